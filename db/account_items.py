@@ -1,23 +1,34 @@
 # db/account_items.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.cache import reference_cache
 import logging
 
+# 勘定科目の選択肢・設定画面で使う列（_fetch_account_items で取得する列）
+ACCOUNT_ITEM_COLUMNS = ("id", "name")
+
+@reference_cache
+def _fetch_account_items() -> list:
+    """account_items テーブルを名前順に取得（全セッション共通キャッシュ）"""
+    res = supabase.table("account_items").select(select_list(ACCOUNT_ITEM_COLUMNS)).order("name").execute()
+    return res.data if res.data else []
+
 def get_account_items() -> list:
     try:
-        res = supabase.table("account_items").select("*").order("name").execute()
-        return res.data if res.data else []
+        return _fetch_account_items()
     except Exception as e:
         logging.error(f"get_account_items error: {e}")
         return []
 
 def save_account_item(name: str) -> str:
     try:
-        existing = supabase.table("account_items").select("*").eq("name", name).execute()
+        existing = supabase.table("account_items").select("id").eq("name", name).execute()
         if existing.data:
             return "duplicate"
 
         supabase.table("account_items").insert({"name": name}).execute()
+        _fetch_account_items.clear()
         return "success"
     except Exception as e:
         logging.error(f"save_account_item error: {e}")
@@ -27,6 +38,7 @@ def save_account_item(name: str) -> str:
 def delete_account_item(item_id: int) -> bool:
     try:
         supabase.table("account_items").delete().eq("id", item_id).execute()
+        _fetch_account_items.clear()
         return True
     except Exception as e:
         logging.error(f"delete_account_item error: {e}")
@@ -1,35 +1,39 @@
 # db/all_expense.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.bulk import insert_ledger_rows, update_ledger_rows, delete_ledger_rows
+from db.pagination import iter_pages, fetch_all
+from db.totals import recompute_month_totals
+from db.data_versions import bump_data_versions, month_keys
+from db.pl_monthly import refresh_pl_monthly, refresh_pl_monthly_batch
 from datetime import datetime
 import logging
 
-def get_expenses(year: int, month: int, top_category: str) -> list:
-    """指定された月・カテゴリの出金明細をページネーションで取得"""
-    try:
-        BATCH_SIZE = 1000
-        all_data = []
-        offset = 0
+# 出金明細グリッド・固定費の重複判定で使う列（get_expenses の既定）
+EXPENSE_COLUMNS = ("id", "partner", "account", "detail", "payment", "cost")
+
+# 明細・合計テーブルと集計列（db.bulk の台帳ヘルパーに渡す）
+LEDGER = ("all_expense", "all_expense_total", "second_category", "cost", "total_cost")
 
-        while True:
+def get_expenses(year: int, month: int, top_category: str, second_category: str = None, columns: tuple = EXPENSE_COLUMNS) -> list:
+    """
+    指定された月・カテゴリの出金明細をページネーションで取得
+    second_category を指定するとその費目だけをサーバー側で絞り込む
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    """
+    try:
+        def build_query():
             query = supabase.table("all_expense")\
-                .select("*")\
+                .select(select_list(columns))\
                 .eq("year", year)\
                 .eq("month", month)\
-                .eq("top_category", top_category)\
-                .order("id")\
-                .range(offset, offset + BATCH_SIZE - 1)
-
-            res = query.execute()
-            batch = res.data or []
-            all_data.extend(batch)
+                .eq("top_category", top_category)
+            if second_category is not None:
+                query = query.eq("second_category", second_category)
+            return query
 
-            if len(batch) < BATCH_SIZE:
-                break  # 最後まで到達
-
-            offset += BATCH_SIZE
-
-        return all_data
+        return fetch_all(build_query)
     except Exception as e:
         logging.error(f"get_expenses error: {e}")
         return []
@@ -49,47 +53,96 @@ def add_expense(year: int, month: int, partner: str, account: str, detail: str,
             "top_category": top_category,
             "updated_at": datetime.now().isoformat()
         }).execute()
+        bump_data_versions({(top_category, year, month)})
         return True
     except Exception as e:
         logging.error(f"add_expense error: {e}")
         return False
 
+def add_expenses_bulk(year: int, month: int, rows: list[dict], second_category: str, top_category: str) -> tuple[list[dict | None], dict | None]:
+    """
+    複数の出金データを1回の insert でまとめて追加し、行ごとの登録後の行（id を含む、失敗した行は None）と版を返す
+    rows: [{"partner", "account", "detail", "payment", "cost"}, ...]
+    """
+    now = datetime.now().isoformat()
+    payload = [
+        {
+            "year": year,
+            "month": month,
+            "partner": row["partner"],
+            "account": row["account"],
+            "detail": row["detail"],
+            "payment": row["payment"],
+            "cost": row["cost"],
+            "second_category": second_category,
+            "top_category": top_category,
+            "updated_at": now
+        }
+        for row in rows
+    ]
+    return insert_ledger_rows(*LEDGER, payload, refresh_pl_monthly_batch)
+
 def delete_expense(expense_id: int) -> bool:
     """指定した出金データを削除"""
     try:
-        supabase.table("all_expense").delete().eq("id", expense_id).execute()
+        res = supabase.table("all_expense").delete().eq("id", expense_id).execute()
+        bump_data_versions(month_keys(res.data or []))
         return True
     except Exception as e:
         logging.error(f"delete_expense error: {e}")
         return False
 
+def update_expenses_bulk(rows: list[dict]) -> tuple[list[dict] | None, dict | None]:
+    """変更された出金データ（id を含む全項目）をまとめて更新し、更新後の行（失敗時は None）と版を返す"""
+    return update_ledger_rows(*LEDGER, rows, refresh_pl_monthly_batch)
+
+def delete_expenses_bulk(expense_ids: list[int], month_key: tuple = None) -> tuple[list[dict] | None, dict | None]:
+    """
+    指定した出金データを id リストでまとめて削除し、削除した行（失敗時は None）と版を返す
+    month_key: 削除対象の (top_category, year, month)。削除した行が返らなかった場合の再集計に使う
+    """
+    return delete_ledger_rows(*LEDGER, expense_ids, month_key, refresh_pl_monthly_batch)
+
 def update_expense_totals_by_category(year: int, month: int, second_category: str, top_category: str) -> bool:
     """指定カテゴリの出金データを合計してall_expense_totalに保存"""
     try:
-        # 指定条件で該当データ取得
-        res = supabase.table("all_expense").select("*")\
-            .eq("year", year).eq("month", month)\
-            .eq("second_category", second_category).eq("top_category", top_category).execute()
+        # 指定条件で該当データをページ単位で取得し、金額だけを逐次合計
+        total_cost = 0
+        row_count = 0
+        pages = iter_pages(lambda: supabase.table("all_expense").select("id, cost")
+                           .eq("year", year).eq("month", month)
+                           .eq("second_category", second_category).eq("top_category", top_category))
+        for batch in pages:
+            total_cost += sum(row.get("cost", 0) for row in batch)
+            row_count += len(batch)
+
         # 既存の合計レコードを削除（件数ゼロの場合もここで消す）
         supabase.table("all_expense_total").delete()\
             .eq("year", year).eq("month", month)\
             .eq("second_category", second_category).eq("top_category", top_category).execute()
 
-        if not res.data:
-            return True
-
-        total_cost = sum(row.get("cost", 0) for row in res.data)
-
         # 登録
-        supabase.table("all_expense_total").insert({
-            "year": year,
-            "month": month,
-            "second_category": second_category,
-            "top_category": top_category,
-            "total_cost": total_cost,
-            "updated_at": datetime.now().isoformat()
-        }).execute()
+        if row_count:
+            supabase.table("all_expense_total").insert({
+                "year": year,
+                "month": month,
+                "second_category": second_category,
+                "top_category": top_category,
+                "total_cost": total_cost,
+                "updated_at": datetime.now().isoformat()
+            }).execute()
+
+        bump_data_versions({(top_category, year, month)})
         return True
     except Exception as e:
         logging.error(f"[update_expense_totals_by_category] Error: {e}")
-        return False
\ No newline at end of file
+        return False
+def update_expense_month_totals(year: int, month: int, top_category: str, second_categories: list = None) -> bool:
+    """
+    指定月・事業部の出金データを second_category ごとにまとめて再集計し all_expense_total に保存
+    second_categories 指定時はそのカテゴリだけ（固定費反映後など）。対象月の pl_monthly も更新
+    """
+    ok = recompute_month_totals("all_expense", "all_expense_total", "second_category", "cost", "total_cost",
+                                year, month, top_category, second_categories)
+    refresh_pl_monthly(year, month, top_category)
+    return ok
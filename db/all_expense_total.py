@@ -1,9 +1,18 @@
 # db/all_expense_total.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.pagination import fetch_all
+from db.cache import versioned_cache
+from db.data_versions import read_versioned
+from db.periods import filter_periods
+from db.pl_monthly import refresh_pl_monthly
 from datetime import datetime
 import logging
 
+# 合計行の集計に使う列（読み出し関数の既定）
+TOTAL_COLUMNS = ("id", "year", "month", "top_category", "second_category", "total_cost")
+
 def save_expense_totals(year: int, month: int, top_category: str, totals: dict) -> bool:
     """カテゴリごとの出金合計をall_expense_totalテーブルに保存（上書き）"""
     try:
@@ -27,6 +36,7 @@ def save_expense_totals(year: int, month: int, top_category: str, totals: dict)
             for second_category, cost in totals.items()
         ]
         supabase.table("all_expense_total").insert(payload).execute()
+        refresh_pl_monthly(year, month, top_category)
         return True
     except Exception as e:
         logging.error(f"save_expense_totals error: {e}")
@@ -36,7 +46,7 @@ def get_expense_totals(year: int, month: int, top_category: str) -> dict:
     """指定年月・事業部のカテゴリ別出金合計を取得"""
     try:
         res = supabase.table("all_expense_total")\
-            .select("*")\
+            .select("second_category, total_cost")\
             .eq("year", year)\
             .eq("month", month)\
             .eq("top_category", top_category)\
@@ -46,44 +56,65 @@ def get_expense_totals(year: int, month: int, top_category: str) -> dict:
         logging.error(f"get_expense_totals error: {e}")
         return {}
     
-def get_expense_totals_batch(years: list, top_category: str) -> list:
+@versioned_cache
+def _fetch_expense_totals_batch(years: tuple, top_category: str, periods: tuple | None, columns: tuple, versions: tuple | None) -> list:
+    """get_expense_totals_batch の取得本体（versions はキャッシュキーとしてのみ使う）"""
+    def build_query():
+        query = supabase.table("all_expense_total").select(select_list(columns))\
+            .in_("year", list(years)).eq("top_category", top_category)
+        return filter_periods(query, *periods) if periods else query
+
+    return fetch_all(build_query)
+
+def get_expense_totals_batch(years: list, top_category: str, periods: tuple = None, columns: tuple = TOTAL_COLUMNS) -> list:
     """
     複数年の全出金（second_categoryごと）を一括取得
-    返り値は [{year, month, second_category, total_cost}, ...] のリスト
+    periods=(start_period, end_period) を指定すると、その期間の月だけをサーバー側で絞り込む
+    data_versions に変化がなければキャッシュ済みの結果を返す
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    返り値は [{year, month, top_category, second_category, total_cost}, ...] のリスト
     """
     try:
-        res = supabase.table("all_expense_total").select("*")\
-            .in_("year", years).eq("top_category", top_category)\
-            .execute()
-        return res.data if res.data else []
+        return read_versioned(_fetch_expense_totals_batch, years, [top_category], tuple(years), top_category, periods, tuple(columns))
     except Exception as e:
         logging.error(f"get_expense_totals_batch error: {e}")
         return []
     
-def get_expense_totals_all(years: list) -> list:
-    """全事業部の出金合計を対象年で一括取得（ページネーション対応）"""
-    try:
-        BATCH_SIZE = 1000
-        all_data = []
-        offset = 0
-
-        while True:
-            query = supabase.table("all_expense_total")\
-                .select("*")\
-                .in_("year", years)\
-                .order("id")\
-                .range(offset, offset + BATCH_SIZE - 1)
+@versioned_cache
+def _fetch_expense_totals_multi(years: tuple, top_categories: tuple, periods: tuple | None, columns: tuple, versions: tuple | None) -> list:
+    """get_expense_totals_multi の取得本体（versions はキャッシュキーとしてのみ使う）"""
+    def build_query():
+        query = supabase.table("all_expense_total").select(select_list(columns))\
+            .in_("year", list(years)).in_("top_category", list(top_categories))
+        return filter_periods(query, *periods) if periods else query
 
-            res = query.execute()
-            batch = res.data or []
-            all_data.extend(batch)
+    return fetch_all(build_query)
 
-            if len(batch) < BATCH_SIZE:
-                break
-
-            offset += BATCH_SIZE
+def get_expense_totals_multi(years: list, top_categories: list, periods: tuple = None, columns: tuple = TOTAL_COLUMNS) -> list:
+    """
+    複数事業部・複数年の全出金（second_categoryごと）を1回のページ送りで一括取得
+    periods=(start_period, end_period) を指定すると、その期間の月だけをサーバー側で絞り込む
+    data_versions に変化がなければキャッシュ済みの結果を返す
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    返り値は [{year, month, top_category, second_category, total_cost}, ...] のリスト
+    """
+    try:
+        return read_versioned(_fetch_expense_totals_multi, years, top_categories, tuple(years), tuple(top_categories), periods, tuple(columns))
+    except Exception as e:
+        logging.error(f"get_expense_totals_multi error: {e}")
+        return []
+    
+def get_expense_totals_all(years: list, periods: tuple = None, columns: tuple = TOTAL_COLUMNS) -> list:
+    """
+    全事業部の出金合計を対象年で一括取得（ページネーション対応、periods 指定時はその期間の月のみ）
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    """
+    try:
+        def build_query():
+            query = supabase.table("all_expense_total").select(select_list(columns)).in_("year", years)
+            return filter_periods(query, *periods) if periods else query
 
-        return all_data
+        return fetch_all(build_query)
     except Exception as e:
         logging.error(f"get_expense_totals_all error: {e}")
         return []
@@ -1,9 +1,14 @@
 # db/all_expense_total_depreciation.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.pagination import fetch_all
 from datetime import datetime
 import logging
 
+# 合計行の集計に使う列（読み出し関数の既定）
+TOTAL_COLUMNS = ("id", "year", "month", "top_category", "second_category", "total_cost")
+
 def save_expense_totals(year: int, month: int, top_category: str, totals: dict) -> bool:
     """カテゴリごとの出金合計をaall_expense_total_depreciationテーブルに保存（上書き）"""
     try:
@@ -36,7 +41,7 @@ def get_expense_totals(year: int, month: int, top_category: str) -> dict:
     """指定年月・事業部のカテゴリ別出金合計を取得"""
     try:
         res = supabase.table("aall_expense_total_depreciation")\
-            .select("*")\
+            .select("second_category, total_cost")\
             .eq("year", year)\
             .eq("month", month)\
             .eq("top_category", top_category)\
@@ -46,44 +51,28 @@ def get_expense_totals(year: int, month: int, top_category: str) -> dict:
         logging.error(f"get_expense_totals error: {e}")
         return {}
     
-def get_expense_totals_batch(years: list, top_category: str) -> list:
+def get_expense_totals_batch(years: list, top_category: str, columns: tuple = TOTAL_COLUMNS) -> list:
     """
     複数年の全出金（second_categoryごと）を一括取得
-    返り値は [{year, month, second_category, total_cost}, ...] のリスト
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    返り値は [{year, month, top_category, second_category, total_cost}, ...] のリスト
     """
     try:
-        res = supabase.table("aall_expense_total_depreciation").select("*")\
-            .in_("year", years).eq("top_category", top_category)\
-            .execute()
-        return res.data if res.data else []
+        return fetch_all(lambda: supabase.table("aall_expense_total_depreciation").select(select_list(columns))
+                         .in_("year", years).eq("top_category", top_category))
     except Exception as e:
         logging.error(f"get_expense_totals_batch error: {e}")
         return []
     
-def get_expense_totals_all(years: list) -> list:
-    """全事業部の出金合計を対象年で一括取得（ページネーション対応）"""
+def get_expense_totals_all(years: list, columns: tuple = TOTAL_COLUMNS) -> list:
+    """
+    全事業部の出金合計を対象年で一括取得（ページネーション対応）
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    """
     try:
-        BATCH_SIZE = 1000
-        all_data = []
-        offset = 0
-
-        while True:
-            query = supabase.table("aall_expense_total_depreciation")\
-                .select("*")\
-                .in_("year", years)\
-                .order("id")\
-                .range(offset, offset + BATCH_SIZE - 1)
-
-            res = query.execute()
-            batch = res.data or []
-            all_data.extend(batch)
-
-            if len(batch) < BATCH_SIZE:
-                break
-
-            offset += BATCH_SIZE
-
-        return all_data
+        return fetch_all(lambda: supabase.table("aall_expense_total_depreciation")
+                         .select(select_list(columns))
+                         .in_("year", years))
     except Exception as e:
         logging.error(f"get_expense_totals_all error: {e}")
         return []
@@ -1,35 +1,31 @@
 # db/all_sales.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.bulk import insert_ledger_rows, update_ledger_rows, delete_ledger_rows
+from db.pagination import iter_rows, fetch_all
+from db.data_versions import bump_data_versions, month_keys
+from db.pl_monthly import refresh_pl_monthly_batch
 from datetime import datetime
 import logging
 
-def get_sales(year: int, month: int, top_category: str) -> list:
-    """指定された月・カテゴリの入金明細をページネーションで取得"""
-    try:
-        BATCH_SIZE = 1000
-        all_data = []
-        offset = 0
-
-        while True:
-            query = supabase.table("all_sales")\
-                .select("*")\
-                .eq("year", year)\
-                .eq("month", month)\
-                .eq("top_category", top_category)\
-                .order("id")\
-                .range(offset, offset + BATCH_SIZE - 1)
-
-            res = query.execute()
-            batch = res.data or []
-            all_data.extend(batch)
+# 入金明細グリッドで使う列（get_sales の既定）
+SALES_COLUMNS = ("id", "partner", "detail", "expected_amount", "received_amount", "payment", "invoice_issued", "tax_rate")
 
-            if len(batch) < BATCH_SIZE:
-                break
+# 明細・合計テーブルと集計列（db.bulk の台帳ヘルパーに渡す）
+LEDGER = ("all_sales", "all_sales_total", "tax_rate", "received_amount", "total_amount")
 
-            offset += BATCH_SIZE
-
-        return all_data
+def get_sales(year: int, month: int, top_category: str, columns: tuple = SALES_COLUMNS) -> list:
+    """
+    指定された月・カテゴリの入金明細をページネーションで取得
+    columns に指定した列だけを取得する（全列が必要な場合は db.columns.ALL_COLUMNS）
+    """
+    try:
+        return fetch_all(lambda: supabase.table("all_sales")
+                         .select(select_list(columns))
+                         .eq("year", year)
+                         .eq("month", month)
+                         .eq("top_category", top_category))
     except Exception as e:
         logging.error(f"get_sales error: {e}")
         return []
@@ -50,35 +46,68 @@ def add_sale(year: int, month: int, partner: str, detail: str, expected_amount:
             "tax_rate": tax_rate,
             "updated_at": datetime.now().isoformat()
         }).execute()
+        bump_data_versions({(top_category, year, month)})
         return True
     except Exception as e:
         logging.error(f"add_sale error: {e}")
         return False
 
+def add_sales_bulk(year: int, month: int, rows: list[dict], top_category: str) -> tuple[list[dict | None], dict | None]:
+    """
+    複数の入金データを1回の insert でまとめて追加し、行ごとの登録後の行（id を含む、失敗した行は None）と版を返す
+    rows: [{"partner", "detail", "expected_amount", "received_amount", "payment", "invoice_issued", "tax_rate"}, ...]
+    """
+    now = datetime.now().isoformat()
+    payload = [
+        {
+            "year": year,
+            "month": month,
+            "partner": row["partner"],
+            "detail": row["detail"],
+            "expected_amount": row["expected_amount"],
+            "received_amount": row["received_amount"],
+            "payment": row["payment"],
+            "invoice_issued": row["invoice_issued"],
+            "top_category": top_category,
+            "tax_rate": row["tax_rate"],
+            "updated_at": now
+        }
+        for row in rows
+    ]
+    return insert_ledger_rows(*LEDGER, payload, refresh_pl_monthly_batch)
+
 def delete_sale(sale_id: int) -> bool:
     """指定した入金データを削除"""
     try:
-        supabase.table("all_sales").delete().eq("id", sale_id).execute()
+        res = supabase.table("all_sales").delete().eq("id", sale_id).execute()
+        bump_data_versions(month_keys(res.data or []))
         return True
     except Exception as e:
         logging.error(f"delete_sale error: {e}")
         return False
 
+def update_sales_bulk(rows: list[dict]) -> tuple[list[dict] | None, dict | None]:
+    """変更された入金データ（id を含む全項目）をまとめて更新し、更新後の行（失敗時は None）と版を返す"""
+    return update_ledger_rows(*LEDGER, rows, refresh_pl_monthly_batch)
+
+def delete_sales_bulk(sale_ids: list[int], month_key: tuple = None) -> tuple[list[dict] | None, dict | None]:
+    """
+    指定した入金データを id リストでまとめて削除し、削除した行（失敗時は None）と版を返す
+    month_key: 削除対象の (top_category, year, month)。削除した行が返らなかった場合の再集計に使う
+    """
+    return delete_ledger_rows(*LEDGER, sale_ids, month_key, refresh_pl_monthly_batch)
+
 def update_sales_total(year: int, month: int, top_category: str) -> bool:
     """その月・事業部の入金データを tax_rate ごとに合計し all_sales_total に保存"""
     try:
-        # 対象データ取得
-        res = supabase.table("all_sales").select("*")\
-            .eq("year", year)\
-            .eq("month", month)\
-            .eq("top_category", top_category)\
-            .execute()
-
-        data = res.data if res.data else []
-
-        # tax_rate ごとに group by
+        # 対象データをページ単位で取得し、tax_rate ごとに逐次合計
         totals_by_tax = {}
-        for row in data:
+        rows = iter_rows(lambda: supabase.table("all_sales")
+                         .select("id, tax_rate, received_amount")
+                         .eq("year", year)
+                         .eq("month", month)
+                         .eq("top_category", top_category))
+        for row in rows:
             tax = row.get("tax_rate", "売上10%")
             amount = row.get("received_amount", 0)
             totals_by_tax[tax] = totals_by_tax.get(tax, 0) + amount
@@ -90,17 +119,22 @@ def update_sales_total(year: int, month: int, top_category: str) -> bool:
             .eq("top_category", top_category)\
             .execute()
 
-        # 複数の tax_rate ごとに登録
-        for tax_rate, total_amount in totals_by_tax.items():
-            supabase.table("all_sales_total").insert({
-                "year": year,
-                "month": month,
-                "top_category": top_category,
-                "tax_rate": tax_rate,
-                "total_amount": total_amount,
-                "updated_at": datetime.now().isoformat()
-            }).execute()
+        # 複数の tax_rate をまとめて登録
+        if totals_by_tax:
+            now = datetime.now().isoformat()
+            supabase.table("all_sales_total").insert([
+                {
+                    "year": year,
+                    "month": month,
+                    "top_category": top_category,
+                    "tax_rate": tax_rate,
+                    "total_amount": total_amount,
+                    "updated_at": now
+                }
+                for tax_rate, total_amount in totals_by_tax.items()
+            ]).execute()
 
+        bump_data_versions({(top_category, year, month)})
         return True
     except Exception as e:
         logging.error(f"update_sales_total error: {e}")
@@ -0,0 +1,171 @@
+# db/bulk.py
+
+from db.supabase_client import supabase
+from db.totals import add_signed_amounts, apply_total_deltas, recompute_month_totals
+from db.data_versions import month_keys
+from datetime import datetime
+import logging
+
+def insert_rows(table: str, payload: list[dict]) -> list[dict | None]:
+    """
+    payload を1回の insert でまとめて登録し、行ごとに登録後の行（id を含む）を返す（失敗した行は None）。
+    一括登録が失敗した場合のみ1行ずつ登録し直し、失敗した行を特定する。
+    """
+    if not payload:
+        return []
+
+    try:
+        res = supabase.table(table).insert(payload).execute()
+    except Exception as e:
+        logging.error(f"insert_rows({table}) bulk error: {e}")
+    else:
+        # 登録結果が返らない設定でも、登録済みの行を再登録しないよう送った内容を返す
+        return res.data or [dict(row) for row in payload]
+
+    results = []
+    for row in payload:
+        try:
+            res = supabase.table(table).insert(row).execute()
+            results.append(res.data[0] if res.data else dict(row))
+        except Exception as e:
+            logging.error(f"insert_rows({table}) row error: {e}")
+            results.append(None)
+    return results
+
+def upsert_rows(table: str, rows: list[dict]) -> list[dict] | None:
+    """id を含む行をまとめて upsert し、複数行の更新を1リクエストで反映する。更新後の行を返す（失敗時は None）"""
+    if not rows:
+        return []
+
+    try:
+        res = supabase.table(table).upsert(rows, on_conflict="id").execute()
+        return res.data or []
+    except Exception as e:
+        logging.error(f"upsert_rows({table}) error: {e}")
+        return None
+
+def delete_rows(table: str, ids: list[int]) -> list[dict] | None:
+    """id リストに該当する行を1リクエストでまとめて削除し、削除した行を返す（失敗時は None）"""
+    if not ids:
+        return []
+
+    try:
+        res = supabase.table(table).delete().in_("id", ids).execute()
+        return res.data or []
+    except Exception as e:
+        logging.error(f"delete_rows({table}) error: {e}")
+        return None
+
+# --- 明細テーブル（台帳）の一括書き込み ---
+# 入金・出金・減価償却の各台帳は、テーブル名と集計列を渡してこれらのヘルパーで書き込む
+# 書き込んだ行の金額を差分として合計テーブルへ加算し、refresh(対象月の集合, 差分) で pl_monthly・版を更新する
+# 合計を再集計した場合は差分が合計と一致しないため、refresh(対象月の集合) とだけ呼ぶ
+# 各ヘルパーは (書き込み結果の行, 版) を返す。版は refresh が返す {(top_category, year, month): (書き込み前の版, 書き込んだ版)} で、
+# 合計を再集計した・書き込み結果が揃わなかった場合は None（呼び出し側は結果の行で表示中の値を差し替えず、読み直す）
+
+def sync_ledger_totals(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                       deltas: dict, refresh) -> dict | None:
+    """差分を合計テーブルに加算して対象月を refresh し、版を返す。加算に失敗した場合のみ対象月を全件再集計する"""
+    keys = {(top_category, year, month) for year, month, top_category, _ in deltas}
+    if apply_total_deltas(total_table, group_column, total_column, deltas):
+        return refresh(keys, deltas)
+    for top_category, year, month in keys:
+        recompute_month_totals(ledger, total_table, group_column, amount_column, total_column,
+                               year, month, top_category)
+    refresh(keys)
+    return None
+
+def recompute_ledger_months(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                            keys: set, refresh) -> None:
+    """
+    書き込み結果の行が依頼した件数に足りない（行の表現なし・RLS で見えない等）と差分が取れないため、
+    対象月 keys（(top_category, year, month) の集合）を全件再集計する
+    """
+    if not keys:
+        logging.warning(f"recompute_ledger_months({ledger}): 書き込んだ行が返らず対象月が不明のため、"
+                        f"合計は reconcile_totals_batch.py で補正されます")
+    for top_category, year, month in keys:
+        recompute_month_totals(ledger, total_table, group_column, amount_column, total_column, year, month, top_category)
+    refresh(keys)
+
+def insert_ledger_rows(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                       payload: list[dict], refresh) -> tuple[list[dict | None], dict | None]:
+    """
+    payload を1回の insert でまとめて登録し、行ごとの登録後の行（失敗した行は None）と版を返す。
+    登録できた行の金額を合計に加算する。
+    """
+    results = insert_rows(ledger, payload)
+    inserted = [row for row in results if row]
+    versions = sync_ledger_totals(ledger, total_table, group_column, amount_column, total_column,
+                                  add_signed_amounts({}, inserted, group_column, amount_column, 1), refresh)
+    return results, versions
+
+def fetch_ledger_rows(ledger: str, group_column: str, amount_column: str, ids: list[int]) -> list | None:
+    """差分計算用に、更新前の金額と集計キーを id 指定で取得（失敗時は None）"""
+    try:
+        res = supabase.table(ledger)\
+            .select(f"id, year, month, top_category, {group_column}, {amount_column}")\
+            .in_("id", ids)\
+            .execute()
+        return res.data or []
+    except Exception as e:
+        logging.error(f"fetch_ledger_rows({ledger}) error: {e}")
+        return None
+
+def update_ledger_rows(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                       rows: list[dict], refresh) -> tuple[list[dict] | None, dict | None]:
+    """
+    変更された行（id を含む全項目）をまとめて更新し、更新後の行（失敗時は None）と版を返す。
+    更新前の行を取得し、DB が返した更新後の行との差分（新 − 旧）を合計に加算する。
+    """
+    if not rows:
+        return [], {}
+
+    old_rows = fetch_ledger_rows(ledger, group_column, amount_column, [row["id"] for row in rows])
+    if old_rows is None:
+        return None, None
+
+    # upsert は存在しない id を新規行として登録してしまうため、既存の id だけを更新する
+    existing_ids = {row["id"] for row in old_rows}
+    rows = [row for row in rows if row["id"] in existing_ids]
+    if not rows:
+        return [], None
+
+    now = datetime.now().isoformat()
+    updated = upsert_rows(ledger, [{**row, "updated_at": now} for row in rows])
+    if updated is None:
+        return None, None
+
+    if len(updated) == len(rows):
+        # 加算側は送った値ではなく、DB が保存した値（返った行）を使う
+        deltas = add_signed_amounts({}, old_rows, group_column, amount_column, -1)
+        versions = sync_ledger_totals(ledger, total_table, group_column, amount_column, total_column,
+                                      add_signed_amounts(deltas, updated, group_column, amount_column, 1), refresh)
+        return updated, versions
+
+    recompute_ledger_months(ledger, total_table, group_column, amount_column, total_column,
+                            month_keys(old_rows) | month_keys(rows), refresh)
+    return updated, None
+
+def delete_ledger_rows(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                       ids: list[int], month_key: tuple, refresh) -> tuple[list[dict] | None, dict | None]:
+    """
+    id リストに該当する行をまとめて削除し、削除した行（失敗時は None）と版を返す。
+    削除した行がそのまま返るため、差分計算用の事前取得はしない。
+    month_key: 削除対象の (top_category, year, month)。返った行が足りない場合の再集計に使う
+    """
+    if not ids:
+        return [], {}
+
+    deleted = delete_rows(ledger, ids)
+    if deleted is None:
+        return None, None
+
+    if len(deleted) == len(ids):
+        versions = sync_ledger_totals(ledger, total_table, group_column, amount_column, total_column,
+                                      add_signed_amounts({}, deleted, group_column, amount_column, -1), refresh)
+        return deleted, versions
+
+    recompute_ledger_months(ledger, total_table, group_column, amount_column, total_column,
+                            month_keys(deleted) | ({month_key} if month_key else set()), refresh)
+    return deleted, None
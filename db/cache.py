@@ -0,0 +1,29 @@
+# db/cache.py
+
+import streamlit as st
+
+# 参照系テーブル（事業部・費目・勘定科目など）のキャッシュ有効期間（秒）
+REFERENCE_TTL = 600
+
+
+def reference_cache(func):
+    """
+    参照系テーブルの取得関数を全セッション共通でキャッシュする。
+    例外時はキャッシュされないため、取得関数側では例外を握りつぶさないこと。
+    更新系の関数からは func.clear() で明示的に破棄する。
+    """
+    return st.cache_data(ttl=REFERENCE_TTL, show_spinner=False)(func)
+
+
+# 集計テーブル（合計・pl_monthly）のキャッシュ保持件数と、念のための有効期間（秒）
+VERSIONED_MAX_ENTRIES = 128
+VERSIONED_TTL = 3600
+
+
+def versioned_cache(func):
+    """
+    集計テーブルの取得関数を、最後の引数 versions（data_versions の版）込みで全セッション共通にキャッシュする。
+    対象月のどれかに書き込みがあると versions が変わり、次回は取り直しになる。
+    取得関数側では例外を握りつぶさないこと。
+    """
+    return st.cache_data(ttl=VERSIONED_TTL, max_entries=VERSIONED_MAX_ENTRIES, show_spinner=False)(func)
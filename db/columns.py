@@ -0,0 +1,16 @@
+# db/columns.py
+
+# 読み出し関数は返す列を既定値として宣言し、必要な列だけを取得する
+# 全列が必要な呼び出し側だけ columns=ALL_COLUMNS を渡す
+ALL_COLUMNS = ("*",)
+
+
+def select_list(columns) -> str:
+    """
+    列の並び（タプル・リスト）を select() に渡す文字列にする
+    db.pagination.iter_pages のページ送りは id を使うため、呼び出し側が指定しなくても id は必ず含める
+    """
+    columns = list(columns)
+    if "*" not in columns and "id" not in columns:
+        columns.insert(0, "id")
+    return ", ".join(columns)
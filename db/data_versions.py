@@ -0,0 +1,96 @@
+# db/data_versions.py
+
+from db.supabase_client import supabase
+from db.pagination import iter_pages
+import logging
+import time
+
+# data_versions: (top_category, year, month) ごとの更新版。明細・合計を書き込むたびに値が変わる（定義は db/data_versions.sql）
+# 集計の読み出し側はこの版をキャッシュキーに含め、変化がなければキャッシュ済みの結果を使い回す
+
+
+def month_keys(rows: list[dict]) -> set:
+    """行リストから (top_category, year, month) の集合を作る"""
+    return {(row["top_category"], row["year"], row["month"]) for row in rows}
+
+
+def bump_data_versions(keys) -> dict | None:
+    """
+    指定した (top_category, year, month) の版を1回の rpc（db/data_versions.sql）でまとめて更新し、
+    {(top_category, year, month): (書き込み前の版, 書き込んだ版)} を返す（失敗時は None）
+    版は書き込み時刻（ナノ秒）とし、読み出し不要で必ず前回と異なる値にする
+    書き込み前の版はサーバー側で更新と同時に読むため、呼び出し側は間に他の書き込みがあったかを判定できる
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    try:
+        version = time.time_ns()
+        res = supabase.rpc("bump_data_versions", {
+            "p_keys": [
+                {"top_category": top_category, "year": year, "month": month}
+                for top_category, year, month in keys
+            ],
+            "p_version": version
+        }).execute()
+        return {
+            (row["top_category"], row["year"], row["month"]): (row["previous"], version)
+            for row in res.data or []
+        }
+    except Exception as e:
+        logging.error(f"bump_data_versions error: {e}")
+        return None
+
+
+def get_data_versions(years: list, top_categories: list = None) -> tuple | None:
+    """
+    対象年（・事業部）の版を1回の問い合わせで取得し、キャッシュキーに使える tuple で返す
+    取得に失敗した場合は None
+    """
+    try:
+        def build_query():
+            query = supabase.table("data_versions")\
+                .select("id, top_category, year, month, version")\
+                .in_("year", list(years))
+            if top_categories is not None:
+                query = query.in_("top_category", list(top_categories))
+            return query
+
+        versions = []
+        for batch in iter_pages(build_query):
+            versions.extend((row["top_category"], row["year"], row["month"], row["version"]) for row in batch)
+        return tuple(sorted(versions))
+    except Exception as e:
+        logging.error(f"get_data_versions error: {e}")
+        return None
+
+
+def get_data_version(top_category: str, year: int, month: int) -> int | None:
+    """
+    1つの (top_category, year, month) の版を取得（未登録なら 0）
+    取得に失敗した場合は None
+    """
+    try:
+        res = supabase.table("data_versions")\
+            .select("version")\
+            .eq("top_category", top_category)\
+            .eq("year", year)\
+            .eq("month", month)\
+            .execute()
+        return res.data[0]["version"] if res.data else 0
+    except Exception as e:
+        logging.error(f"get_data_version error: {e}")
+        return None
+
+
+def read_versioned(fetch, years: list, top_categories: list, *args):
+    """
+    版を1回だけ問い合わせ、変化がなければ fetch のキャッシュ済み結果を返す
+    fetch は db.cache.versioned_cache で包んだ取得関数で、最後の引数に版（versions）を受け取る
+    版が取れなかった場合はキャッシュを使わずに取得する
+    """
+    versions = get_data_versions(years, top_categories)
+    if versions is None:
+        return fetch.__wrapped__(*args, None)
+    return fetch(*args, versions)
@@ -0,0 +1,53 @@
+-- db/data_versions.sql
+-- 事業部 × 年月ごとの更新版（db/data_versions.py が明細・合計の書き込みのたびに更新する）
+
+create table if not exists data_versions (
+    id bigint generated by default as identity primary key,
+    top_category text not null,
+    year integer not null,
+    month integer not null,
+    version bigint not null,
+    updated_at timestamp,
+    unique (top_category, year, month)
+);
+
+-- 版の更新（db/data_versions.py の bump_data_versions が supabase.rpc で呼び出す）
+-- p_keys: [{"top_category": "店A", "year": 2025, "month": 8}, ...]
+-- 月ごとに p_version を書き込み、書き込む直前の版（未登録なら 0）を返す
+-- 読み出しと書き込みを同じ行ロックの中で行うため、呼び出し側は自分の書き込みの前後に他の書き込みがあったかを判定できる
+create or replace function bump_data_versions(p_keys jsonb, p_version bigint)
+returns table (top_category text, year integer, month integer, previous bigint)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    k record;
+begin
+    for k in
+        select distinct x.top_category, x.year, x.month
+        from jsonb_to_recordset(p_keys) as x(top_category text, year integer, month integer)
+    loop
+        insert into data_versions (top_category, year, month, version, updated_at)
+        values (k.top_category, k.year, k.month, p_version, now())
+        on conflict (top_category, year, month) do nothing;
+
+        if found then
+            previous := 0;
+        else
+            select d.version into previous
+            from data_versions d
+            where d.top_category = k.top_category and d.year = k.year and d.month = k.month
+            for update;
+
+            update data_versions d
+            set version = p_version, updated_at = now()
+            where d.top_category = k.top_category and d.year = k.year and d.month = k.month;
+        end if;
+
+        top_category := k.top_category;
+        year := k.year;
+        month := k.month;
+        return next;
+    end loop;
+end;
+$$;
@@ -1,14 +1,24 @@
 # db/default_partners.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.cache import reference_cache
 from datetime import datetime
 import logging
 
+# デフォルト行の設定画面・出金明細の初期行で使う列（_fetch_default_partners で取得する列）
+DEFAULT_PARTNER_COLUMNS = ("id", "second_category", "partner", "account", "detail", "payment", "top_category")
+
+@reference_cache
+def _fetch_default_partners() -> list:
+    """default_partners テーブルを id 順に取得（全セッション共通キャッシュ）"""
+    res = supabase.table("default_partners").select(select_list(DEFAULT_PARTNER_COLUMNS)).order("id").execute()
+    return res.data if res.data else []
+
 def get_default_partners() -> list:
     """登録されているすべてのデフォルト行を取得"""
     try:
-        res = supabase.table("default_partners").select("*").order("id").execute()
-        return res.data if res.data else []
+        return _fetch_default_partners()
     except Exception as e:
         logging.error(f"get_default_partners error: {e}")
         return []
@@ -17,7 +27,7 @@ def save_default_partner(second_category: str, partner: str, account: str, detai
     """新しいデフォルト行を登録（重複チェックあり）"""
     try:
         existing = supabase.table("default_partners") \
-            .select("*") \
+            .select("id") \
             .eq("second_category", second_category) \
             .eq("partner", partner) \
             .eq("account", account) \
@@ -38,6 +48,7 @@ def save_default_partner(second_category: str, partner: str, account: str, detai
             "top_category": top_category,
             "updated_at": datetime.now().isoformat()
         }).execute()
+        _fetch_default_partners.clear()
 
         return "success"
     except Exception as e:
@@ -51,6 +62,7 @@ def update_default_partner(id: int, field: str, value) -> bool:
             field: value,
             "updated_at": datetime.now().isoformat()
         }).eq("id", id).execute()
+        _fetch_default_partners.clear()
         return True
     except Exception as e:
         logging.error(f"update_default_partner error: {e}")
@@ -60,6 +72,7 @@ def delete_default_partner(id: int) -> bool:
     """デフォルト行を削除"""
     try:
         supabase.table("default_partners").delete().eq("id", id).execute()
+        _fetch_default_partners.clear()
         return True
     except Exception as e:
         logging.error(f"delete_default_partner error: {e}")
@@ -68,13 +81,10 @@ def delete_default_partner(id: int) -> bool:
 def get_default_partners_by_category(second_category: str, top_category: str) -> list:
     """カテゴリ（second_category）と事業部（top_category）に応じたデフォルト取引先一覧を取得"""
     try:
-        res = supabase.table("default_partners") \
-            .select("*") \
-            .eq("second_category", second_category) \
-            .eq("top_category", top_category) \
-            .order("id") \
-            .execute()
-        return res.data if res.data else []
+        return [
+            row for row in _fetch_default_partners()
+            if row.get("second_category") == second_category and row.get("top_category") == top_category
+        ]
     except Exception as e:
         logging.error(f"get_default_partners_by_category error: {e}")
         return []
@@ -1,13 +1,22 @@
 # db/divisions.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.cache import reference_cache
 import logging
 
+# 事業部の一覧・設定画面で使う列（_fetch_division_rows で取得する列）
+DIVISION_COLUMNS = ("id", "name", "sort_order", "type", "brand")
+
+@reference_cache
+def _fetch_division_rows() -> list:
+    """divisions テーブルを sort_order 順に取得（全セッション共通キャッシュ）"""
+    res = supabase.table("divisions").select(select_list(DIVISION_COLUMNS)).order("sort_order").execute()
+    return res.data if res.data else []
+
 def get_divisions():
     try:
-        # sort_order 順に取得
-        res = supabase.table("divisions").select("*").order("sort_order").execute()
-        return [row["name"] for row in res.data] if res.data else []
+        return [row["name"] for row in _fetch_division_rows()]
     except Exception as e:
         logging.error(f"get_divisions error: {e}")
         return []
@@ -28,6 +37,7 @@ def add_division(name: str, division_type: str = None, brand: str = None) -> str
         if brand:
             payload["brand"] = brand
         supabase.table("divisions").insert(payload).execute()
+        _fetch_division_rows.clear()
         return "success"
     except Exception as e:
         logging.error(f"add_division error: {e}")
@@ -36,6 +46,7 @@ def add_division(name: str, division_type: str = None, brand: str = None) -> str
 def update_division(id: int, new_name: str):
     try:
         supabase.table("divisions").update({"name": new_name}).eq("id", id).execute()
+        _fetch_division_rows.clear()
         return True
     except Exception as e:
         logging.error(f"update_division error: {e}")
@@ -44,6 +55,7 @@ def update_division(id: int, new_name: str):
 def update_division_type(id: int, division_type: str) -> bool:
     try:
         supabase.table("divisions").update({"type": division_type}).eq("id", id).execute()
+        _fetch_division_rows.clear()
         return True
     except Exception as e:
         logging.error(f"update_division_type error: {e}")
@@ -52,6 +64,7 @@ def update_division_type(id: int, division_type: str) -> bool:
 def update_division_brand(id: int, brand: str) -> bool:
     try:
         supabase.table("divisions").update({"brand": brand}).eq("id", id).execute()
+        _fetch_division_rows.clear()
         return True
     except Exception as e:
         logging.error(f"update_division_brand error: {e}")
@@ -60,6 +73,7 @@ def update_division_brand(id: int, brand: str) -> bool:
 def delete_division(id: int):
     try:
         supabase.table("divisions").delete().eq("id", id).execute()
+        _fetch_division_rows.clear()
         return True
     except Exception as e:
         logging.error(f"delete_division error: {e}")
@@ -67,9 +81,7 @@ def delete_division(id: int):
 
 def get_division_records():
     try:
-        # sort_order 順に取得
-        res = supabase.table("divisions").select("*").order("sort_order").execute()
-        return res.data if res.data else []
+        return _fetch_division_rows()
     except Exception as e:
         logging.error(f"get_division_records error: {e}")
         return []
@@ -82,4 +94,7 @@ def update_division_order(division_records: list[dict]) -> bool:
         return True
     except Exception as e:
         logging.error(f"update_division_order error: {e}")
-        return False
\ No newline at end of file
+        return False
+    finally:
+        # 途中で失敗しても一部は更新済みのため必ず破棄する
+        _fetch_division_rows.clear()
\ No newline at end of file
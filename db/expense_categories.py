@@ -1,17 +1,21 @@
 # db/expense_categories.py
 
 from db.supabase_client import supabase
+from db.cache import reference_cache
 import logging
 
+@reference_cache
+def _fetch_expense_category_rows() -> list:
+    """expense_categories テーブルを sort_order 順に取得（全セッション共通キャッシュ）"""
+    res = supabase.table("expense_categories")\
+        .select("second_category, sort_order, is_fixed")\
+        .order("sort_order").execute()
+    return res.data if res.data else []
+
 def get_expense_categories() -> list[str]:
     """登録済みカテゴリを sort_order 順に取得"""
     try:
-        res = supabase.table("expense_categories")\
-            .select("second_category, sort_order")\
-            .order("sort_order").execute()
-        if res.data:
-            return [row["second_category"] for row in res.data if row.get("second_category")]
-        return []
+        return [row["second_category"] for row in _fetch_expense_category_rows() if row.get("second_category")]
     except Exception as e:
         logging.error(f"get_expense_categories error: {e}")
         return []
@@ -33,6 +37,7 @@ def add_expense_category(category: str, is_fixed: bool = False) -> str:
                 "sort_order": max_order,
                 "is_fixed": is_fixed  # ← 追加
             }).execute()
+        _fetch_expense_category_rows.clear()
         return "success"
     except Exception as e:
         logging.error(f"add_expense_category error: {e}")
@@ -42,6 +47,7 @@ def add_expense_category(category: str, is_fixed: bool = False) -> str:
 def delete_expense_category(category: str) -> bool:
     try:
         supabase.table("expense_categories").delete().eq("second_category", category).execute()
+        _fetch_expense_category_rows.clear()
         return True
     except Exception as e:
         logging.error(f"delete_expense_category error: {e}")
@@ -57,18 +63,17 @@ def update_expense_category_order(name_order_list: list[str]) -> bool:
     except Exception as e:
         logging.error(f"update_expense_category_order error: {e}")
         return False
+    finally:
+        # 途中で失敗しても一部は更新済みのため必ず破棄する
+        _fetch_expense_category_rows.clear()
 
 def get_variable_expense_categories() -> list[str]:
     """変動費カテゴリ（is_fixed=False）だけ取得"""
     try:
-        res = supabase.table("expense_categories")\
-            .select("second_category, sort_order")\
-            .eq("is_fixed", False)\
-            .order("sort_order")\
-            .execute()
-        if res.data:
-            return [row["second_category"] for row in res.data if row.get("second_category")]
-        return []
+        return [
+            row["second_category"] for row in _fetch_expense_category_rows()
+            if row.get("second_category") and row.get("is_fixed") is False
+        ]
     except Exception as e:
         logging.error(f"get_variable_expense_categories error: {e}")
         return []
@@ -76,14 +81,26 @@ def get_variable_expense_categories() -> list[str]:
 def get_fixed_expense_categories() -> list[str]:
     """固定費カテゴリ（is_fixed=True）だけ取得"""
     try:
-        res = supabase.table("expense_categories")\
-            .select("second_category, sort_order")\
-            .eq("is_fixed", True)\
-            .order("sort_order")\
-            .execute()
-        if res.data:
-            return [row["second_category"] for row in res.data if row.get("second_category")]
-        return []
+        return [
+            row["second_category"] for row in _fetch_expense_category_rows()
+            if row.get("second_category") and row.get("is_fixed") is True
+        ]
     except Exception as e:
         logging.error(f"get_fixed_expense_categories error: {e}")
         return []
+
+def get_expense_category_groups() -> tuple[list[str], list[str]]:
+    """変動費カテゴリと固定費カテゴリを1回の取得でまとめて返す（変動費, 固定費）"""
+    try:
+        variable, fixed = [], []
+        for row in _fetch_expense_category_rows():
+            if not row.get("second_category"):
+                continue
+            if row.get("is_fixed") is False:
+                variable.append(row["second_category"])
+            elif row.get("is_fixed") is True:
+                fixed.append(row["second_category"])
+        return variable, fixed
+    except Exception as e:
+        logging.error(f"get_expense_category_groups error: {e}")
+        return [], []
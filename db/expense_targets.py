@@ -1,22 +1,39 @@
 # db/expense_targets.py
 
 from db.supabase_client import supabase
+from db.columns import ALL_COLUMNS, select_list
+from db.cache import reference_cache
 import logging
 from datetime import datetime
 
+# 目標比率の設定画面・ダッシュボード・グラフで使う列（_fetch_expense_targets で取得する列）
+EXPENSE_TARGET_COLUMNS = (
+    "id", "top_category", "cost_rate", "labor_rate", "fl_rate", "misc_rate", "utility_rate",
+    "other_fixed_rate", "rent_rate", "flr_rate", "ad_rate", "first_op_profit_rate",
+)
+
+@reference_cache
+def _fetch_expense_targets() -> list:
+    """expense_targets テーブルを全件取得（全セッション共通キャッシュ）"""
+    response = supabase.table("expense_targets").select(select_list(EXPENSE_TARGET_COLUMNS)).execute()
+    return response.data if response.data else []
+
 def get_expense_targets():
     """全ての事業部の目標比率を取得（リスト形式で返す）"""
     try:
-        response = supabase.table("expense_targets").select("*").execute()
-        return response.data if response.data else []
+        return _fetch_expense_targets()
     except Exception as e:
         logging.error(f"get_expense_targets error: {e}")
         return []
 
-def get_expense_target_by_top_category(top_category: str):
-    """特定の事業部の目標比率を取得（辞書形式）"""
+def get_expense_target_map() -> dict:
+    """全事業部の目標比率を top_category をキーにした辞書で返す（1回の取得で全事業部分）"""
+    return {row["top_category"]: row for row in get_expense_targets()}
+
+def get_expense_target_by_top_category(top_category: str, columns: tuple = ALL_COLUMNS):
+    """特定の事業部の目標比率を取得（辞書形式、columns を指定するとその列だけ）"""
     try:
-        response = supabase.table("expense_targets").select("*").eq("top_category", top_category).limit(1).execute()
+        response = supabase.table("expense_targets").select(select_list(columns)).eq("top_category", top_category).limit(1).execute()
         return response.data[0] if response.data else None
     except Exception as e:
         logging.error(f"get_expense_target_by_top_category error: {e}")
@@ -40,8 +57,8 @@ def upsert_expense_target(payload: dict):
     }
     """
     try:
-        # 既存レコードの有無をチェック
-        existing = get_expense_target_by_top_category(payload["top_category"])
+        # 既存レコードの有無をチェック（id だけ取得）
+        existing = get_expense_target_by_top_category(payload["top_category"], columns=("id",))
 
         if existing:
             supabase.table("expense_targets").update({
@@ -53,6 +70,7 @@ def upsert_expense_target(payload: dict):
                 **payload,
                 "updated_at": datetime.now().isoformat()
             }).execute()
+        _fetch_expense_targets.clear()
         return True
     except Exception as e:
         logging.error(f"upsert_expense_target error: {e}")
@@ -1,17 +1,27 @@
 # db/fixed_categories.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
 from datetime import datetime
 import logging
 from db.account_items import get_account_items
+from db.bulk import insert_rows, upsert_rows, delete_rows
+from db.data_versions import bump_data_versions, month_keys
+from db.pagination import iter_pages
+from db.periods import filter_periods
+from db.totals import add_signed_amounts, apply_total_deltas, recompute_month_totals
+from db.pl_monthly import refresh_pl_monthly_batch
 from decimal import Decimal
 import streamlit as st
 
+# 固定費の設定画面・一括反映で使う列（get_fixed_categories で取得する列）
+FIXED_CATEGORY_COLUMNS = ("id", "partner", "account", "detail", "payment", "cost", "top_category", "second_category")
+
 
 def get_fixed_categories() -> list:
     """登録されているすべての固定費項目を取得"""
     try:
-        res = supabase.table("fixed_categories").select("*").execute()
+        res = supabase.table("fixed_categories").select(select_list(FIXED_CATEGORY_COLUMNS)).execute()
         return res.data if res.data else []
     except Exception as e:
         logging.error(f"get_fixed_categories error: {e}")
@@ -74,6 +84,7 @@ def apply_fixed_expenses(year: int, month: int, selected_top_category: str) -> b
         if not getattr(r2, "data", None):
             failed_depreciation = len(new_rows)
 
+        bump_data_versions({(selected_top_category, year, month)})
         success = failed_expense == 0 and failed_depreciation == 0
         return success, failed_expense, failed_depreciation
 
@@ -81,12 +92,97 @@ def apply_fixed_expenses(year: int, month: int, selected_top_category: str) -> b
         logging.error(f"apply_fixed_expenses error: {e}")
         return False, -1, -1
 
+def apply_fixed_expenses_batch(start_period: int, end_period: int, top_categories: list = None) -> tuple:
+    """
+    固定費を全事業部（top_categories 指定時はその事業部のみ）の期間内の各月へまとめて反映する（バッチ処理用）。
+    期間は期間キー（year*100+month）の範囲で指定する。
+    固定費の取得1回、台帳ごとに既存行の取得1回と一括登録1回、合計の差分反映と pl_monthly の更新1回ずつで済ませる。
+    同じ内容（取引先・勘定科目・摘要・金額）が登録済みの月には追加しない。
+    返り値は (success, 追加件数, 出金テーブルの失敗件数, 減価償却テーブルの失敗件数)
+    """
+    try:
+        fixed_items = [
+            f for f in get_fixed_categories()
+            if top_categories is None or f.get("top_category") in top_categories
+        ]
+        if not fixed_items:
+            return True, 0, 0, 0
+
+        divisions = sorted({f["top_category"] for f in fixed_items})
+        months = [(p // 100, p % 100) for p in range(start_period, end_period + 1) if 1 <= p % 100 <= 12]
+
+        # 両台帳の既存行を期間・事業部でまとめて取得
+        existing = set()
+        for ledger in ("all_expense", "all_expense_depreciation"):
+            pages = iter_pages(lambda ledger=ledger: filter_periods(
+                supabase.table(ledger)
+                .select("id, year, month, top_category, partner, account, detail, cost")
+                .in_("top_category", divisions),
+                start_period, end_period
+            ))
+            for batch in pages:
+                existing.update(
+                    (e["year"], e["month"], e["top_category"], e["partner"], e["account"], e["detail"], float(e["cost"]))
+                    for e in batch
+                )
+
+        now = datetime.now().isoformat()
+        new_rows = [
+            {
+                "year": year,
+                "month": month,
+                "partner": row["partner"],
+                "account": row["account"],
+                "detail": row["detail"],
+                "payment": row["payment"],
+                "cost": float(row["cost"]),
+                "second_category": row["second_category"],
+                "top_category": row["top_category"],
+                "updated_at": now
+            }
+            for year, month in months
+            for row in fixed_items
+            if (year, month, row["top_category"], row["partner"], row["account"], row["detail"], float(row["cost"])) not in existing
+        ]
+        if not new_rows:
+            return True, 0, 0, 0
+
+        failed = {}
+        touched = set()
+        cube_deltas = None
+        for ledger, total_table in (("all_expense", "all_expense_total"),
+                                    ("all_expense_depreciation", "all_expense_total_depreciation")):
+            results = insert_rows(ledger, new_rows)
+            inserted = [row for row, ok in zip(new_rows, results) if ok]
+            failed[ledger] = len(new_rows) - len(inserted)
+
+            # 合計は差分で反映し、失敗した場合のみ対象月を再集計
+            deltas = add_signed_amounts({}, inserted, "second_category", "cost", 1)
+            if apply_total_deltas(total_table, "second_category", "total_cost", deltas):
+                # pl_monthly は出金合計から作るため、出金の差分が合計に加算できた場合だけ同じ差分を加算する
+                if ledger == "all_expense":
+                    cube_deltas = deltas
+            else:
+                for year, month, top_category in {key[:3] for key in deltas}:
+                    recompute_month_totals(ledger, total_table, "second_category", "cost", "total_cost",
+                                           year, month, top_category)
+            touched |= month_keys(inserted)
+
+        refresh_pl_monthly_batch(touched, cube_deltas)
+
+        success = not any(failed.values())
+        return success, len(new_rows), failed["all_expense"], failed["all_expense_depreciation"]
+
+    except Exception as e:
+        logging.error(f"apply_fixed_expenses_batch error: {e}")
+        return False, 0, -1, -1
+
 
 
 def save_fixed_category(partner: str, account: str, detail: str, payment: str, cost: float, top_category: str, second_category: str) -> str:
     try:
         existing = supabase.table("fixed_categories") \
-            .select("*") \
+            .select("id") \
             .eq("partner", partner) \
             .eq("account", account) \
             .eq("detail", detail) \
@@ -134,3 +230,11 @@ def update_fixed_category(id: int, field: str, value) -> bool:
         logging.error(f"update_fixed_category error: {e}")
         return False
 
+def update_fixed_categories_bulk(rows: list[dict]) -> bool:
+    """編集された固定費項目（id を含む全項目）をまとめて更新"""
+    now = datetime.now().isoformat()
+    return upsert_rows("fixed_categories", [{**row, "updated_at": now} for row in rows]) is not None
+
+def delete_fixed_categories_bulk(fixed_ids: list[int]) -> bool:
+    """固定費項目を id リストでまとめて削除"""
+    return delete_rows("fixed_categories", fixed_ids) is not None
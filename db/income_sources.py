@@ -1,13 +1,23 @@
 # db/income_sources.py
 
 from db.supabase_client import supabase
+from db.columns import select_list
+from db.cache import reference_cache
 import logging
 from datetime import datetime
 
+# 入金元の設定画面・入金明細の初期行で使う列（_fetch_income_sources で取得する列）
+INCOME_SOURCE_COLUMNS = ("id", "top_category", "partner", "expected_amount", "received_amount", "payment", "detail", "tax_rate")
+
+@reference_cache
+def _fetch_income_sources() -> list:
+    """income_sources テーブルを id 順に取得（全セッション共通キャッシュ）"""
+    res = supabase.table("income_sources").select(select_list(INCOME_SOURCE_COLUMNS)).order("id").execute()
+    return res.data if res.data else []
+
 def get_income_sources() -> list:
     try:
-        res = supabase.table("income_sources").select("*").order("id").execute()
-        return res.data if res.data else []
+        return _fetch_income_sources()
     except Exception as e:
         logging.error(f"get_income_sources error: {e}")
         return []
@@ -24,6 +34,7 @@ def add_income_source(data: dict) -> str:
             "tax_rate": data.get("tax_rate", ""),
             "updated_at": datetime.now().isoformat()
         }).execute()
+        _fetch_income_sources.clear()
         return "success"
     except Exception as e:
         logging.error(f"add_income_source error: {e}")
@@ -35,6 +46,7 @@ def update_income_source(id: int, field: str, value) -> bool:
             field: value,
             "updated_at": datetime.now().isoformat()
         }).eq("id", id).execute()
+        _fetch_income_sources.clear()
         return True
     except Exception as e:
         logging.error(f"update_income_source error: {e}")
@@ -43,6 +55,7 @@ def update_income_source(id: int, field: str, value) -> bool:
 def delete_income_source(id: int) -> bool:
     try:
         supabase.table("income_sources").delete().eq("id", id).execute()
+        _fetch_income_sources.clear()
         return True
     except Exception as e:
         logging.error(f"delete_income_source error: {e}")
@@ -0,0 +1,35 @@
+# db/pagination.py
+
+BATCH_SIZE = 1000
+
+def iter_pages(build_query, batch_size: int = BATCH_SIZE):
+    """
+    build_query() で作ったクエリを id 順にページ送りし、1ページ（行リスト）ずつ返すジェネレータ。
+    前ページの最後の id より大きい行だけを取る keyset 方式のため、深いページでも遅くならず、
+    読み出し中に行が追加・削除されても取りこぼしや重複が起きない。
+    build_query() は毎回新しいクエリを返し、select に id を含めること。
+    """
+    last_id = None
+
+    while True:
+        query = build_query()
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        res = query.order("id").limit(batch_size).execute()
+        batch = res.data or []
+        if batch:
+            yield batch
+
+        if len(batch) < batch_size:
+            break  # 最後まで到達
+
+        last_id = batch[-1]["id"]
+
+def iter_rows(build_query, batch_size: int = BATCH_SIZE):
+    """iter_pages のページを1行ずつ返すジェネレータ（集計や DataFrame 化へ全件を溜めずに流す用）"""
+    for batch in iter_pages(build_query, batch_size):
+        yield from batch
+
+def fetch_all(build_query, batch_size: int = BATCH_SIZE) -> list:
+    """iter_pages で全件を取り切ってリストで返す"""
+    return list(iter_rows(build_query, batch_size))
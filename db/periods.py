@@ -0,0 +1,28 @@
+# db/periods.py
+
+# 期間キー: year * 100 + month（例: 2025年8月 → 202508）
+
+
+def years_in_periods(start_period: int, end_period: int) -> list:
+    """期間キーの範囲にかかる暦年のリスト"""
+    return list(range(start_period // 100, end_period // 100 + 1))
+
+
+def filter_periods(query, start_period: int, end_period: int):
+    """
+    year / month 列を持つテーブルへのクエリを、期間キーの範囲 [start_period, end_period] に絞り込む
+    年をまたぐ範囲は or 条件にしてサーバー側で絞り、範囲外の月を取得しない
+    """
+    start_year, start_month = divmod(start_period, 100)
+    end_year, end_month = divmod(end_period, 100)
+
+    if start_year == end_year:
+        return query.eq("year", start_year).gte("month", start_month).lte("month", end_month)
+
+    conditions = [
+        f"and(year.eq.{start_year},month.gte.{start_month})",
+        f"and(year.eq.{end_year},month.lte.{end_month})",
+    ]
+    if end_year - start_year > 1:
+        conditions.append(f"and(year.gt.{start_year},year.lt.{end_year})")
+    return query.or_(",".join(conditions))
@@ -0,0 +1,49 @@
+# db/pl_lines.py
+
+# PLの基礎行の定義（db.pl_monthly のキューブと modules.pl_engine の計算で共通）
+
+# --- 集計テーブルのキー → PL行名 ---
+SALES_LINES = {
+    "売上10%": "売上（税率10%）",
+    "売上8%": "売上（税率8%）",
+    "その他売上10%": "その他売上（税率10%）",
+    "その他売上8%": "その他売上（税率8%）",
+}
+
+EXPENSE_LINES = {
+    "原価（仕入れ高）": "原価",
+    "人件費": "人件費",
+    "源泉税・地方税・社会保険料": "源泉税・地方税・社会保険料",
+    "水道光熱費": "水道光熱費",
+    "消耗品費・その他諸経費": "消耗品費・その他諸経費",
+    "その他固定費": "その他固定費",
+    "家賃": "家賃",
+    "広告費": "広告費",
+    "融資返済利息": "融資返済利息",
+    "臨時諸経費": "臨時諸経費",
+    "（非課税）保険料・税金等": "（非課税）保険料・税金等",
+    "インセンティブ支給総額": "インセンティブ支給総額",
+    "融資返済元金": "融資返済元金",
+}
+
+# --- pl_monthly テーブルの列名（基礎行 → 列） ---
+# 派生行（総売上・利益・税額など）は列に持たず、読み出し側で基礎行から計算する
+PL_COLUMNS = {
+    "売上（税率10%）": "sales_10",
+    "売上（税率8%）": "sales_8",
+    "その他売上（税率10%）": "other_sales_10",
+    "その他売上（税率8%）": "other_sales_8",
+    "原価": "cost",
+    "人件費": "labor",
+    "源泉税・地方税・社会保険料": "payroll_tax",
+    "水道光熱費": "utility",
+    "消耗品費・その他諸経費": "misc",
+    "その他固定費": "other_fixed",
+    "家賃": "rent",
+    "広告費": "ad",
+    "融資返済利息": "loan_interest",
+    "臨時諸経費": "extraordinary",
+    "（非課税）保険料・税金等": "non_taxable",
+    "インセンティブ支給総額": "incentive",
+    "融資返済元金": "loan_principal",
+}
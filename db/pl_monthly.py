@@ -0,0 +1,222 @@
+# db/pl_monthly.py
+
+from db.supabase_client import supabase
+from db.columns import select_list
+from db.pagination import iter_rows, fetch_all
+from db.cache import reference_cache, versioned_cache
+from db.data_versions import bump_data_versions, month_keys, read_versioned
+from db.periods import filter_periods
+from db.pl_lines import EXPENSE_LINES, PL_COLUMNS, SALES_LINES
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+# pl_monthly: 事業部 × 年月 を1行とし、PLの基礎行（売上・費目）を列に持つ集計キューブ（定義は db/pl_monthly.sql）
+# 明細の保存では合計テーブルに加えた差分をそのまま加算し、それ以外の経路では対象月だけを合計テーブルから再計算して維持する
+# 派生行は基礎行に対して線形でない（法人税額など）ため列に持たず、画面側で build_pl_frame_from_cube が計算する
+
+# 投入済みの年（pl_monthly_backfills）は、投入後の書き込みでも維持されるため pl_monthly から読める
+# 投入の記録がない年は、書き込みのあった月の行しかないため合計テーブルから計算する
+
+# 集計テーブルのキー（税率・費目） → pl_monthly の列
+KEY_COLUMNS = {key: PL_COLUMNS[line] for key, line in [*SALES_LINES.items(), *EXPENSE_LINES.items()]}
+
+CUBE_COLUMNS = ("id", "top_category", "year", "month") + tuple(KEY_COLUMNS.values())
+
+
+def _cube_rows(sales_dict: dict, expense_dict: dict) -> list[dict]:
+    """
+    {(year, month, top_category, key): 金額} の売上・出金合計から pl_monthly の行を作る
+    辞書に現れた (top_category, year, month) ごとに1行とし、金額のない列は0にする
+    """
+    now = datetime.now().isoformat()
+    rows = {}
+    for (year, month, top_category, key), value in [*sales_dict.items(), *expense_dict.items()]:
+        row = rows.get((top_category, year, month))
+        if row is None:
+            row = {"top_category": top_category, "year": year, "month": month, "updated_at": now}
+            row.update({column: 0.0 for column in KEY_COLUMNS.values()})
+            rows[(top_category, year, month)] = row
+        if key in KEY_COLUMNS:
+            row[KEY_COLUMNS[key]] += float(value or 0)
+    return list(rows.values())
+
+
+def _upsert_cube_rows(rows: list[dict]) -> None:
+    """(top_category, year, month) をキーにまとめて upsert"""
+    if rows:
+        supabase.table("pl_monthly").upsert(rows, on_conflict="top_category,year,month").execute()
+
+
+def refresh_pl_monthly(year: int, month: int, top_category: str) -> bool:
+    """指定月・事業部の pl_monthly 行を、その月の売上・出金合計だけから再計算して保存"""
+    return refresh_pl_monthly_batch({(top_category, year, month)}) is not None
+
+
+def _recompute_cube_rows(keys: set) -> None:
+    """
+    複数の (top_category, year, month) の pl_monthly 行を売上・出金合計から再計算して保存
+    売上・出金合計はそれぞれ1回の問い合わせ（ページ送り）で取得し、書き込みも1回の upsert で済ませる
+    """
+    if not keys:
+        return
+
+    years = sorted({year for _, year, _ in keys})
+    months = sorted({month for _, _, month in keys})
+    top_categories = sorted({top_category for top_category, _, _ in keys})
+
+    # 合計が0件の月も0の行で上書きする
+    sales_dict = {(year, month, top_category, None): 0 for top_category, year, month in keys}
+    for row in iter_rows(lambda: supabase.table("all_sales_total")
+                         .select("id, year, month, top_category, tax_rate, total_amount")
+                         .in_("year", years).in_("month", months).in_("top_category", top_categories)):
+        if (row["top_category"], row["year"], row["month"]) in keys:
+            key = (row["year"], row["month"], row["top_category"], row["tax_rate"])
+            sales_dict[key] = sales_dict.get(key, 0) + (row.get("total_amount") or 0)
+
+    expense_dict = {}
+    for row in iter_rows(lambda: supabase.table("all_expense_total")
+                         .select("id, year, month, top_category, second_category, total_cost")
+                         .in_("year", years).in_("month", months).in_("top_category", top_categories)):
+        if (row["top_category"], row["year"], row["month"]) in keys:
+            key = (row["year"], row["month"], row["top_category"], row["second_category"])
+            expense_dict[key] = expense_dict.get(key, 0) + (row.get("total_cost") or 0)
+
+    _upsert_cube_rows(_cube_rows(sales_dict, expense_dict))
+
+
+def _add_cube_deltas(deltas: dict) -> set:
+    """
+    {(year, month, top_category, key): 差分} を pl_monthly の列へサーバー側で加算し（add_pl_monthly_deltas）、
+    行がまだなく加算できなかった (top_category, year, month) を返す
+    """
+    payload = [
+        {"top_category": top_category, "year": year, "month": month, "column": KEY_COLUMNS[key], "delta": delta}
+        for (year, month, top_category, key), delta in deltas.items()
+        if key in KEY_COLUMNS and delta
+    ]
+    if not payload:
+        return set()
+    res = supabase.rpc("add_pl_monthly_deltas", {"p_deltas": payload}).execute()
+    return month_keys(res.data or [])
+
+
+def refresh_pl_monthly_batch(keys, deltas: dict = None) -> dict | None:
+    """
+    複数の (top_category, year, month) の pl_monthly 行をまとめて更新し、版を進める
+    deltas（合計テーブルへ加算した {(year, month, top_category, key): 差分}）を渡した場合は合計テーブルを読み直さず、
+    同じ差分を pl_monthly に加算する。行がまだない月と、加算自体に失敗した場合だけ合計テーブルから再計算する
+    戻り値は bump_data_versions が返す版（キューブまたは版の更新に失敗した場合は None）
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    try:
+        if deltas is None:
+            _recompute_cube_rows(keys)
+        else:
+            try:
+                missing = _add_cube_deltas(deltas)
+            except Exception as e:
+                logging.error(f"refresh_pl_monthly_batch delta error: {e}")
+                missing = keys
+            _recompute_cube_rows(missing)
+    except Exception as e:
+        logging.error(f"refresh_pl_monthly_batch error: {e}")
+        # 合計テーブル側は更新済みのため、キューブに失敗しても版は進める
+        bump_data_versions(keys)
+        return None
+    return bump_data_versions(keys)
+
+
+def rebuild_pl_monthly(years: list) -> bool:
+    """対象年の pl_monthly を売上・出金合計テーブルから全事業部分まとめて作り直す（初期投入・補正用）"""
+    try:
+        sales_dict = defaultdict(float)
+        for row in iter_rows(lambda: supabase.table("all_sales_total")
+                             .select("id, year, month, top_category, tax_rate, total_amount")
+                             .in_("year", years)):
+            sales_dict[(row["year"], row["month"], row["top_category"], row["tax_rate"])] += row.get("total_amount") or 0
+
+        expense_dict = defaultdict(float)
+        for row in iter_rows(lambda: supabase.table("all_expense_total")
+                             .select("id, year, month, top_category, second_category, total_cost")
+                             .in_("year", years)):
+            expense_dict[(row["year"], row["month"], row["top_category"], row["second_category"])] += row.get("total_cost") or 0
+
+        rows = _cube_rows(dict(sales_dict), dict(expense_dict))
+        _upsert_cube_rows(rows)
+
+        # 合計がなくなった月の行は upsert では上書きされないため削除する
+        rebuilt = month_keys(rows)
+        stale = [
+            row for row in iter_rows(lambda: supabase.table("pl_monthly")
+                                     .select("id, top_category, year, month")
+                                     .in_("year", years))
+            if (row["top_category"], row["year"], row["month"]) not in rebuilt
+        ]
+        if stale:
+            supabase.table("pl_monthly").delete().in_("id", [row["id"] for row in stale]).execute()
+        bump_data_versions(rebuilt | month_keys(stale))
+
+        # 投入済みの年として記録し、画面側の読み出しを pl_monthly に切り替える
+        now = datetime.now().isoformat()
+        supabase.table("pl_monthly_backfills").upsert(
+            [{"year": year, "backfilled_at": now} for year in years], on_conflict="year"
+        ).execute()
+        return True
+    except Exception as e:
+        logging.error(f"rebuild_pl_monthly error: {e}")
+        return False
+
+
+@reference_cache
+def get_backfilled_years() -> tuple:
+    """rebuild_pl_monthly で投入済みの年（投入は別プロセスのバッチのため、反映は REFERENCE_TTL 以内）"""
+    res = supabase.table("pl_monthly_backfills").select("year").execute()
+    return tuple(sorted(row["year"] for row in res.data or []))
+
+
+def is_backfilled(years: list) -> bool:
+    """
+    対象年をすべて pl_monthly から読めるか
+    投入済みの年か、最後に投入した年より後の年（投入後の書き込みだけで作られる年）なら読める
+    """
+    backfilled = get_backfilled_years()
+    if not backfilled:
+        return False
+    return all(year in backfilled or year > backfilled[-1] for year in years)
+
+
+@versioned_cache
+def _fetch_pl_monthly(years: tuple, top_categories: tuple | None, periods: tuple | None, columns: tuple, versions: tuple | None) -> list:
+    """get_pl_monthly の取得本体（versions はキャッシュキーとしてのみ使う）"""
+    def build_query():
+        query = supabase.table("pl_monthly").select(select_list(columns)).in_("year", list(years))
+        if top_categories is not None:
+            query = query.in_("top_category", list(top_categories))
+        return filter_periods(query, *periods) if periods else query
+
+    return fetch_all(build_query)
+
+
+def get_pl_monthly(years: list, top_categories: list = None, periods: tuple = None, columns: tuple = CUBE_COLUMNS) -> list | None:
+    """
+    対象年の pl_monthly 行を取得（top_categories 未指定なら全事業部）
+    periods=(start_period, end_period) を指定すると、その期間の月だけをサーバー側で絞り込む
+    columns の既定は事業部・年月と基礎行の列（派生行は build_pl_frame_from_cube で計算する）
+    data_versions に変化がなければキャッシュ済みの結果を返す
+    対象年が未投入（is_backfilled が False）または取得自体に失敗した場合は None を返し、
+    呼び出し側で合計テーブルからの計算に切り替える
+    """
+    try:
+        if not is_backfilled(years):
+            return None
+        return read_versioned(
+            _fetch_pl_monthly, years, top_categories,
+            tuple(years), tuple(top_categories) if top_categories is not None else None, periods, tuple(columns)
+        )
+    except Exception as e:
+        logging.error(f"get_pl_monthly error: {e}")
+        return None
@@ -0,0 +1,87 @@
+-- db/pl_monthly.sql
+-- 事業部 × 年月ごとの月次PL（db/pl_monthly.py が書き込みのたびに対象月だけ更新する）
+-- 作成後、既存データは python pl_monthly_backfill.py で投入する（投入を記録した年から画面が pl_monthly を読む）
+-- 列は PL の基礎行（売上・費目）だけを持ち、派生行は読み出し側で計算する（列名は db/pl_lines.py の PL_COLUMNS）
+
+create table if not exists pl_monthly (
+    id bigint generated by default as identity primary key,
+    top_category text not null,
+    year integer not null,
+    month integer not null,
+    sales_10 double precision not null default 0,
+    sales_8 double precision not null default 0,
+    other_sales_10 double precision not null default 0,
+    other_sales_8 double precision not null default 0,
+    cost double precision not null default 0,
+    labor double precision not null default 0,
+    payroll_tax double precision not null default 0,
+    utility double precision not null default 0,
+    misc double precision not null default 0,
+    other_fixed double precision not null default 0,
+    rent double precision not null default 0,
+    ad double precision not null default 0,
+    loan_interest double precision not null default 0,
+    extraordinary double precision not null default 0,
+    non_taxable double precision not null default 0,
+    incentive double precision not null default 0,
+    loan_principal double precision not null default 0,
+    updated_at timestamp,
+    unique (top_category, year, month)
+);
+
+-- 以前の定義で作成済みの場合は派生行の列を削除する（差分の加算では維持できないため）
+alter table pl_monthly
+    drop column if exists total_sales,
+    drop column if exists gross_profit,
+    drop column if exists first_op_profit,
+    drop column if exists final_op_profit,
+    drop column if exists taxable_profit,
+    drop column if exists consumption_tax,
+    drop column if exists corporate_tax,
+    drop column if exists retained_earnings;
+
+-- 明細の保存で合計テーブルに加えた差分を、同じ列へ加算する（db/pl_monthly.py の refresh_pl_monthly_batch が呼び出す）
+-- p_deltas: [{"top_category": "店A", "year": 2025, "month": 8, "column": "rent", "delta": 1000}, ...]
+-- 行がまだない月は加算せずに返し、呼び出し側がその月を合計テーブルから作る
+create or replace function add_pl_monthly_deltas(p_deltas jsonb)
+returns table (top_category text, year integer, month integer)
+language plpgsql
+as $$
+declare
+    d record;
+    updated integer;
+begin
+    for d in
+        select * from jsonb_to_recordset(p_deltas)
+            as x(top_category text, year integer, month integer, "column" text, delta double precision)
+    loop
+        if d."column" not in (
+            'sales_10', 'sales_8', 'other_sales_10', 'other_sales_8', 'cost', 'labor',
+            'payroll_tax', 'utility', 'misc', 'other_fixed', 'rent', 'ad',
+            'loan_interest', 'extraordinary', 'non_taxable', 'incentive', 'loan_principal'
+        ) then
+            raise exception 'add_pl_monthly_deltas: unsupported column %', d."column";
+        end if;
+
+        execute format(
+            'update pl_monthly set %1$I = %1$I + $1, updated_at = now()
+             where top_category = $2 and year = $3 and month = $4',
+            d."column"
+        ) using d.delta, d.top_category, d.year, d.month;
+
+        get diagnostics updated = row_count;
+        if updated = 0 then
+            top_category := d.top_category;
+            year := d.year;
+            month := d.month;
+            return next;
+        end if;
+    end loop;
+end;
+$$;
+
+-- pl_monthly_backfill.py（db.pl_monthly.rebuild_pl_monthly）で投入済みの年
+create table if not exists pl_monthly_backfills (
+    year integer primary key,
+    backfilled_at timestamp
+);
@@ -0,0 +1,136 @@
+# db/totals.py
+
+from db.supabase_client import supabase
+from db.pagination import iter_rows
+from db.periods import filter_periods
+from datetime import datetime
+import logging
+
+# 差分で維持している合計値と明細の合計との差として許容する誤差（浮動小数点の丸め分）
+RECONCILE_TOLERANCE = 1e-6
+
+
+def add_signed_amounts(deltas: dict, rows: list[dict], group_column: str, amount_column: str, sign: int) -> dict:
+    """明細行の金額を (year, month, top_category, group) ごとに符号付きで deltas に加算する"""
+    for row in rows:
+        key = (row["year"], row["month"], row["top_category"], row.get(group_column))
+        deltas[key] = deltas.get(key, 0) + sign * (row.get(amount_column) or 0)
+    return deltas
+
+
+def apply_total_deltas(table: str, group_column: str, total_column: str, deltas: dict) -> bool:
+    """
+    明細の追加・更新・削除で生じた差分を合計テーブルに加算する。
+    deltas: {(year, month, top_category, group): 差分}
+    加算はサーバー側の add_total_deltas（db/totals.sql）で1回の rpc にまとめて行い、
+    同じ月・グループを同時に保存しても差分が失われないようにする。
+    """
+    deltas = {k: v for k, v in deltas.items() if v and k[3] is not None}
+    if not deltas:
+        return True
+
+    try:
+        supabase.rpc("add_total_deltas", {
+            "p_table": table,
+            "p_group_column": group_column,
+            "p_total_column": total_column,
+            "p_deltas": [
+                {"year": year, "month": month, "top_category": top_category, "group": group, "delta": delta}
+                for (year, month, top_category, group), delta in deltas.items()
+            ]
+        }).execute()
+        return True
+    except Exception as e:
+        logging.error(f"apply_total_deltas({table}) error: {e}")
+        return False
+
+
+def recompute_month_totals(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                           year: int, month: int, top_category: str, groups: list = None) -> bool:
+    """
+    指定月・事業部の明細を1回のページ送りで読み、group ごとに合計して合計テーブルを置き換える。
+    groups を指定した場合はそのグループだけを対象にする（None なら月全体）。
+    グループ単位の再集計をまとめ、読み出し1回・削除1回・一括登録1回で済ませる。
+    """
+    if groups is not None and not groups:
+        return True
+
+    try:
+        def build_query():
+            query = supabase.table(ledger)\
+                .select(f"id, {group_column}, {amount_column}")\
+                .eq("year", year).eq("month", month).eq("top_category", top_category)
+            return query.in_(group_column, list(groups)) if groups is not None else query
+
+        totals = {}
+        for row in iter_rows(build_query):
+            group = row.get(group_column)
+            totals[group] = totals.get(group, 0) + (row.get(amount_column) or 0)
+
+        # 既存の合計レコードを削除（件数ゼロになったグループもここで消える）
+        query = supabase.table(total_table).delete()\
+            .eq("year", year).eq("month", month).eq("top_category", top_category)
+        if groups is not None:
+            query = query.in_(group_column, list(groups))
+        query.execute()
+
+        now = datetime.now().isoformat()
+        payload = [
+            {
+                "year": year,
+                "month": month,
+                "top_category": top_category,
+                group_column: group,
+                total_column: total,
+                "updated_at": now
+            }
+            for group, total in totals.items()
+            if group is not None
+        ]
+        if payload:
+            supabase.table(total_table).insert(payload).execute()
+        return True
+    except Exception as e:
+        logging.error(f"recompute_month_totals({total_table}) error: {e}")
+        return False
+
+
+def reconcile_totals(ledger: str, total_table: str, group_column: str, amount_column: str, total_column: str,
+                     start_period: int, end_period: int) -> set | None:
+    """
+    期間内の明細と合計テーブルをそれぞれ1回のページ送りで読み、グループごとの合計を突き合わせる。
+    差分の加算で維持している合計がずれている月だけを recompute_month_totals で作り直し、
+    作り直した (top_category, year, month) の集合を返す（失敗時は None）。
+    書き込みの経路からは呼ばず、定期実行のバッチ（reconcile_totals_batch.py）から呼ぶ。
+    """
+    try:
+        expected = {}
+        for row in iter_rows(lambda: filter_periods(
+                supabase.table(ledger).select(f"id, year, month, top_category, {group_column}, {amount_column}"),
+                start_period, end_period)):
+            if row.get(group_column) is not None:
+                key = (row["year"], row["month"], row["top_category"], row[group_column])
+                expected[key] = expected.get(key, 0) + (row.get(amount_column) or 0)
+
+        actual = {}
+        for row in iter_rows(lambda: filter_periods(
+                supabase.table(total_table).select(f"id, year, month, top_category, {group_column}, {total_column}"),
+                start_period, end_period)):
+            key = (row["year"], row["month"], row["top_category"], row[group_column])
+            actual[key] = actual.get(key, 0) + (row.get(total_column) or 0)
+
+        drifted = set()
+        for key in expected.keys() | actual.keys():
+            if abs(expected.get(key, 0) - actual.get(key, 0)) > RECONCILE_TOLERANCE:
+                year, month, top_category, _ = key
+                drifted.add((top_category, year, month))
+
+        repaired = set()
+        for top_category, year, month in sorted(drifted):
+            if recompute_month_totals(ledger, total_table, group_column, amount_column, total_column,
+                                      year, month, top_category):
+                repaired.add((top_category, year, month))
+        return repaired
+    except Exception as e:
+        logging.error(f"reconcile_totals({total_table}) error: {e}")
+        return None
@@ -0,0 +1,110 @@
+-- db/totals.sql
+-- 合計テーブルへの差分加算（db/totals.py の apply_total_deltas が supabase.rpc で呼び出す）
+-- 加算はサーバー側の insert … on conflict do update で行い、同時に保存しても差分が失われないようにする
+
+-- 一意索引を作る前に、集計キーが重複している月の合計を明細から作り直す
+-- （差分加算の導入前は同じキーの行が複数できることがあり、そのままでは索引を作れない）
+-- 作り直した月の pl_monthly は、適用後に pl_monthly_backfill.py を実行して揃える
+begin;
+
+create temporary table duplicate_total_months (
+    total_table text,
+    year integer,
+    month integer,
+    top_category text
+) on commit drop;
+
+insert into duplicate_total_months
+select distinct 'all_sales_total', year, month, top_category
+from all_sales_total
+group by year, month, top_category, tax_rate
+having count(*) > 1;
+
+insert into duplicate_total_months
+select distinct 'all_expense_total', year, month, top_category
+from all_expense_total
+group by year, month, top_category, second_category
+having count(*) > 1;
+
+insert into duplicate_total_months
+select distinct 'all_expense_total_depreciation', year, month, top_category
+from all_expense_total_depreciation
+group by year, month, top_category, second_category
+having count(*) > 1;
+
+delete from all_sales_total t
+using duplicate_total_months d
+where d.total_table = 'all_sales_total'
+  and t.year = d.year and t.month = d.month and t.top_category = d.top_category;
+
+insert into all_sales_total (year, month, top_category, tax_rate, total_amount, updated_at)
+select s.year, s.month, s.top_category, s.tax_rate, sum(coalesce(s.received_amount, 0)), now()
+from all_sales s
+join duplicate_total_months d
+  on d.total_table = 'all_sales_total'
+ and s.year = d.year and s.month = d.month and s.top_category = d.top_category
+where s.tax_rate is not null
+group by s.year, s.month, s.top_category, s.tax_rate;
+
+delete from all_expense_total t
+using duplicate_total_months d
+where d.total_table = 'all_expense_total'
+  and t.year = d.year and t.month = d.month and t.top_category = d.top_category;
+
+insert into all_expense_total (year, month, top_category, second_category, total_cost, updated_at)
+select e.year, e.month, e.top_category, e.second_category, sum(coalesce(e.cost, 0)), now()
+from all_expense e
+join duplicate_total_months d
+  on d.total_table = 'all_expense_total'
+ and e.year = d.year and e.month = d.month and e.top_category = d.top_category
+where e.second_category is not null
+group by e.year, e.month, e.top_category, e.second_category;
+
+delete from all_expense_total_depreciation t
+using duplicate_total_months d
+where d.total_table = 'all_expense_total_depreciation'
+  and t.year = d.year and t.month = d.month and t.top_category = d.top_category;
+
+insert into all_expense_total_depreciation (year, month, top_category, second_category, total_cost, updated_at)
+select e.year, e.month, e.top_category, e.second_category, sum(coalesce(e.cost, 0)), now()
+from all_expense_depreciation e
+join duplicate_total_months d
+  on d.total_table = 'all_expense_total_depreciation'
+ and e.year = d.year and e.month = d.month and e.top_category = d.top_category
+where e.second_category is not null
+group by e.year, e.month, e.top_category, e.second_category;
+
+-- 集計キーごとに1行（on conflict の対象）
+create unique index if not exists all_sales_total_key
+    on all_sales_total (year, month, top_category, tax_rate);
+create unique index if not exists all_expense_total_key
+    on all_expense_total (year, month, top_category, second_category);
+create unique index if not exists all_expense_total_depreciation_key
+    on all_expense_total_depreciation (year, month, top_category, second_category);
+
+commit;
+
+-- p_deltas: [{"year": 2025, "month": 8, "top_category": "店A", "group": "家賃", "delta": 1000}, ...]
+create or replace function add_total_deltas(
+    p_table text,
+    p_group_column text,
+    p_total_column text,
+    p_deltas jsonb
+) returns void
+language plpgsql
+as $$
+begin
+    if p_table not in ('all_sales_total', 'all_expense_total', 'all_expense_total_depreciation') then
+        raise exception 'add_total_deltas: unsupported table %', p_table;
+    end if;
+
+    execute format(
+        'insert into %1$I (year, month, top_category, %2$I, %3$I, updated_at)
+         select d.year, d.month, d.top_category, d."group", d.delta, now()
+         from jsonb_to_recordset($1) as d(year integer, month integer, top_category text, "group" text, delta double precision)
+         on conflict (year, month, top_category, %2$I)
+         do update set %3$I = coalesce(%1$I.%3$I, 0) + excluded.%3$I, updated_at = excluded.updated_at',
+        p_table, p_group_column, p_total_column
+    ) using p_deltas;
+end;
+$$;
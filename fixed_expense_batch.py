@@ -0,0 +1,57 @@
+# fixed_expense_batch.py
+#
+# 固定費を全事業部へまとめて反映するバッチ（画面を開かずに月末締めを行う）
+# Supabase の接続情報は画面と同じく .streamlit/secrets.toml から読むため、リポジトリ直下で実行する
+#
+#   python fixed_expense_batch.py                 # 当月
+#   python fixed_expense_batch.py 2025 7          # 2025年7月
+#   python fixed_expense_batch.py --term 6        # 6期目（8月〜翌7月）の全月
+#   python fixed_expense_batch.py 2025 7 --division 店A --division 店B
+#
+# cron 等で毎月末に実行する想定（同じ固定費は二重登録されない）
+
+import argparse
+import logging
+import sys
+from datetime import date
+from db.fixed_categories import apply_fixed_expenses_batch
+
+# 1期目の開始年（modules.monthly_io.generate_terms と同じ）
+TERM_START_YEAR = 2020
+
+
+def term_periods(term: int) -> tuple:
+    """期（8月〜翌7月）を期間キーの範囲に変換"""
+    begin_year = TERM_START_YEAR + term - 1
+    return begin_year * 100 + 8, (begin_year + 1) * 100 + 7
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="固定費を全事業部へまとめて反映する")
+    parser.add_argument("year", type=int, nargs="?", help="対象年（省略時は当月）")
+    parser.add_argument("month", type=int, nargs="?", help="対象月（省略時は当月）")
+    parser.add_argument("--term", type=int, help="対象の期（指定時は期内の全月）")
+    parser.add_argument("--division", action="append", help="対象の事業部（複数指定可、省略時は全事業部）")
+    args = parser.parse_args(argv)
+
+    if args.term:
+        start_period, end_period = term_periods(args.term)
+    else:
+        today = date.today()
+        year = args.year or today.year
+        month = args.month or today.month
+        start_period = end_period = year * 100 + month
+
+    success, inserted, failed_expense, failed_depreciation = apply_fixed_expenses_batch(
+        start_period, end_period, args.division
+    )
+    logging.info(
+        f"固定費反映 {start_period}〜{end_period}: 追加 {inserted} 件 / "
+        f"出金失敗 {failed_expense} 件 / 減価償却失敗 {failed_depreciation} 件"
+    )
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(main())
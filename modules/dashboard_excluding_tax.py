@@ -1,14 +1,15 @@
 # modules/dashboard_excluding_tax.py
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 from collections import defaultdict
-from db.all_sales_total import get_sales_totals_batch, get_sales_totals_all
-from db.all_expense_total import get_expense_totals_batch, get_expense_totals_all
-from db.expense_targets import get_expense_target_by_top_category
+from db.all_sales_total import get_sales_totals_batch, get_sales_totals_multi, get_sales_totals_all
+from db.all_expense_total import get_expense_totals_batch, get_expense_totals_multi, get_expense_totals_all
+from db.expense_targets import get_expense_target_map
 from db.divisions import get_divisions, get_division_records
-from modules.header import render_pl_table
+from modules.header import format_pl_table, render_pl_table
+from db.pl_monthly import get_pl_monthly
+from modules.pl_engine import build_pl_frame, build_pl_frame_from_cube, add_ratio_rows
 
 # 年度生成
 def generate_terms(start_year=2020):
@@ -46,6 +47,7 @@ def show_dashboard_excluding_tax():
     selected_term = next(t for t in terms if t["label"] == selected_label)
     months = get_months_in_term(selected_term)
     years = sorted(set(int(m.split("-")[0]) for m in months))
+    periods = (int(selected_term["start"].replace("-", "")), int(selected_term["end"].replace("-", "")))
 
     division_records = get_division_records()
     divisions = [r["name"] for r in division_records]
@@ -81,157 +83,60 @@ def show_dashboard_excluding_tax():
     def aggregate_multi_divisions(div_list):
         s_agg = defaultdict(float)
         e_agg = defaultdict(float)
-        for div in div_list:
-            for d in get_sales_totals_batch(years, div):
-                s_agg[(d["year"], d["month"], d["tax_rate"])] += d.get("total_amount", 0)
-            for d in get_expense_totals_batch(years, div):
-                e_agg[(d["year"], d["month"], d["second_category"])] += d.get("total_cost", 0)
+        for d in get_sales_totals_multi(years, div_list, periods):
+            s_agg[(d["year"], d["month"], d["tax_rate"])] += d.get("total_amount", 0)
+        for d in get_expense_totals_multi(years, div_list, periods):
+            e_agg[(d["year"], d["month"], d["second_category"])] += d.get("total_cost", 0)
         return dict(s_agg), dict(e_agg)
 
-    # --- データ取得 ---
+    # --- データ取得（pl_monthly を優先し、未作成・未投入の場合は合計テーブルから計算） ---
     if selected_div == "Lia全体合計":
-        sales_data = get_sales_totals_all(years)
-        expense_data = get_expense_totals_all(years)
-
-        # 合算処理
-        sales_agg = defaultdict(float)
-        for d in sales_data:
-            key = (d["year"], d["month"], d["tax_rate"])
-            sales_agg[key] += d.get("total_amount", 0)
-
-        expense_agg = defaultdict(float)
-        for d in expense_data:
-            key = (d["year"], d["month"], d["second_category"])
-            expense_agg[key] += d.get("total_cost", 0)
-
-        sales_dict = dict(sales_agg)
-        expense_dict = dict(expense_agg)
-
+        cube_divisions = None
     elif selected_div in virtual_div_map:
-        sales_dict, expense_dict = aggregate_multi_divisions(virtual_div_map[selected_div])
-
+        cube_divisions = virtual_div_map[selected_div]
     else:
-        sales_data = get_sales_totals_batch(years, selected_div)
-        expense_data = get_expense_totals_batch(years, selected_div)
-        sales_dict = {(d["year"], d["month"], d["tax_rate"]): d["total_amount"] for d in sales_data}
-        expense_dict = {(d["year"], d["month"], d["second_category"]): d["total_cost"] for d in expense_data}
+        cube_divisions = [selected_div]
+    cube_rows = get_pl_monthly(years, cube_divisions, periods)
 
-    # --- PL構築 ---
-    pl_dict = {
-        "売上（税率10%）": {}, "売上（税率8%）": {}, "その他売上（税率10%）": {}, "その他売上（税率8%）": {},
-        "総売上": {}, "原価": {}, "売上総利益": {}, "人件費": {}, "源泉税・地方税・社会保険料": {}, "水道光熱費": {}, "消耗品費・その他諸経費": {},
-        "その他固定費": {}, "家賃": {}, "広告費": {}, "融資返済利息": {}, "実質営業利益": {}, "臨時諸経費": {}, "（非課税）保険料・税金等": {}, "最終営業利益": {}, "インセンティブ支給総額": {}, "税額計算利益": {}
-    }
-
-    for ym in months:
-        year, month = map(int, ym.split("-"))
-        u10 = sales_dict.get((year, month, "売上10%"), 0) / 1.1
-        u8 = sales_dict.get((year, month, "売上8%"), 0) / 1.08
-        o10 = sales_dict.get((year, month, "その他売上10%"), 0) / 1.1
-        o8 = sales_dict.get((year, month, "その他売上8%"), 0) / 1.08
-        原価 = expense_dict.get((year, month, "原価（仕入れ高）"), 0) / 1.08
-        人件費 = expense_dict.get((year, month, "人件費"), 0)
-        非経費人件費 = expense_dict.get((year, month, "源泉税・地方税・社会保険料"), 0)
-        水道光熱費 = expense_dict.get((year, month, "水道光熱費"), 0) / 1.1
-        消耗品 = expense_dict.get((year, month, "消耗品費・その他諸経費"), 0) / 1.1
-        その他固定費 = expense_dict.get((year, month, "その他固定費"), 0) / 1.1
-        家賃 = expense_dict.get((year, month, "家賃"), 0) / 1.1
-        広告費 = expense_dict.get((year, month, "広告費"), 0) / 1.1
-        融資利息 = expense_dict.get((year, month, "融資返済利息"), 0)
-        臨時 = expense_dict.get((year, month, "臨時諸経費"), 0) / 1.1
-        税金等 = expense_dict.get((year, month, "（非課税）保険料・税金等"), 0)
-        融資元金 = expense_dict.get((year, month, "融資返済元金"), 0)
-        インセンティブ支給総額 = expense_dict.get((year, month, "インセンティブ支給総額"), 0)
+    if not cube_rows:
+        if selected_div == "Lia全体合計":
+            sales_data = get_sales_totals_all(years, periods)
+            expense_data = get_expense_totals_all(years, periods)
 
-        総売上 = u10 + u8 + o10 + o8
-        売上総利益 = 総売上 - 原価
-        実質営業利益 = 売上総利益 - 人件費 - 水道光熱費 - 消耗品  - その他固定費 - 家賃 - 広告費 - 融資利息
-        最終営業利益 = 実質営業利益 - 臨時 - 税金等
-        税額計算利益 = 最終営業利益 - インセンティブ支給総額
+            # 合算処理
+            sales_agg = defaultdict(float)
+            for d in sales_data:
+                key = (d["year"], d["month"], d["tax_rate"])
+                sales_agg[key] += d.get("total_amount", 0)
 
-        for key, value in zip(pl_dict.keys(), [u10, u8, o10, o8, 総売上, 原価, 売上総利益, 人件費, 非経費人件費, 水道光熱費, 消耗品,
-                                               その他固定費, 家賃, 広告費, 融資利息, 実質営業利益, 臨時, 税金等, 最終営業利益, インセンティブ支給総額, 税額計算利益]):
-            pl_dict[key][ym] = value
+            expense_agg = defaultdict(float)
+            for d in expense_data:
+                key = (d["year"], d["month"], d["second_category"])
+                expense_agg[key] += d.get("total_cost", 0)
 
-        # 格納
-        pl_dict["売上（税率10%）"][ym] = u10
-        pl_dict["売上（税率8%）"][ym] = u8
-        pl_dict["その他売上（税率10%）"][ym] = o10
-        pl_dict["その他売上（税率8%）"][ym] = o8
-        pl_dict["総売上"][ym] = 総売上
-        pl_dict["原価"][ym] = 原価
-        pl_dict["売上総利益"][ym] = 売上総利益
-        pl_dict["人件費"][ym] = 人件費
-        pl_dict["源泉税・地方税・社会保険料"][ym] = 非経費人件費
-        pl_dict["水道光熱費"][ym] = 水道光熱費
-        pl_dict["消耗品費・その他諸経費"][ym] = 消耗品
-        pl_dict["その他固定費"][ym] = その他固定費
-        pl_dict["家賃"][ym] = 家賃
-        pl_dict["広告費"][ym] = 広告費
-        pl_dict["融資返済利息"][ym] = 融資利息
-        pl_dict["実質営業利益"][ym] = 実質営業利益
-        pl_dict["臨時諸経費"][ym] = 臨時
-        pl_dict["（非課税）保険料・税金等"][ym] = 税金等
-        pl_dict["最終営業利益"][ym] = 最終営業利益
-        pl_dict["インセンティブ支給総額"][ym] = インセンティブ支給総額
-        pl_dict["税額計算利益"][ym] = 税額計算利益
+            sales_dict = dict(sales_agg)
+            expense_dict = dict(expense_agg)
 
+        elif selected_div in virtual_div_map:
+            sales_dict, expense_dict = aggregate_multi_divisions(virtual_div_map[selected_div])
 
-    # --- DataFrame化 ---
-    df = pd.DataFrame(pl_dict).T
-    df["合計"] = df.sum(axis=1)
-    df = df[["合計"] + months]
+        else:
+            sales_data = get_sales_totals_batch(years, selected_div, periods)
+            expense_data = get_expense_totals_batch(years, selected_div, periods)
+            sales_dict = {(d["year"], d["month"], d["tax_rate"]): d["total_amount"] for d in sales_data}
+            expense_dict = {(d["year"], d["month"], d["second_category"]): d["total_cost"] for d in expense_data}
 
+    # --- PL構築 ---
+    if cube_rows:
+        df = build_pl_frame_from_cube(cube_rows, months, excluding_tax=True)
+    else:
+        df = build_pl_frame(sales_dict, expense_dict, months, excluding_tax=True)
 
     # --- 比率行挿入 ---
-    def pct_row(numerator_row):
-        return {
-            col: (numerator_row[col] / df.loc["総売上", col]) if df.loc["総売上", col] else 0
-            for col in df.columns
-        }
-
-    def insert_after(df, target, label, values):
-        idx = df.index.tolist()
-        i = idx.index(target) + 1
-        upper = df.iloc[:i]
-        lower = df.iloc[i:]
-        insert = pd.DataFrame([values], index=[label])
-        return pd.concat([upper, insert, lower])
-
-    df = insert_after(df, "原価", "原価率", pct_row(df.loc["原価"]))
-    df = insert_after(df, "源泉税・地方税・社会保険料", "人件費率", pct_row(df.loc["人件費"] + df.loc["源泉税・地方税・社会保険料"]))
-    df = insert_after(df, "人件費率", "FL比率", pct_row(df.loc["原価"] + df.loc["人件費"] + df.loc["源泉税・地方税・社会保険料"]))
-    df = insert_after(df, "水道光熱費", "水道光熱費率", pct_row(df.loc["水道光熱費"]))
-    df = insert_after(df, "消耗品費・その他諸経費", "消耗品・その他諸経費率", pct_row(df.loc["消耗品費・その他諸経費"]))
-    df = insert_after(df, "その他固定費", "その他固定費率", pct_row(df.loc["その他固定費"]))
-    df = insert_after(df, "家賃", "家賃率", pct_row(df.loc["家賃"]))
-    df = insert_after(df, "家賃率", "FLR比率", pct_row(df.loc["原価"] + df.loc["人件費"] + df.loc["源泉税・地方税・社会保険料"] + df.loc["家賃"]))
-    df = insert_after(df, "広告費", "広告費率", pct_row(df.loc["広告費"]))
-    df = insert_after(df, "実質営業利益", "実質営業利益率", pct_row(df.loc["実質営業利益"]))
-    df = insert_after(df, "最終営業利益", "最終営業利益率", pct_row(df.loc["最終営業利益"]))
-
-    # --- 表示用変換 ---
-    def format_val(val, row_label):
-        try:
-            if isinstance(val, (int, float)):
-                if "率" in str(row_label) and "税率" not in str(row_label):
-                    return f"{val:.1%}"
-                return f"¥{val:,.0f}"
-        except:
-            pass
-        return val
-
-    df_display = df.copy()
-    df_display["項目"] = df_display.index
-    df_display = df_display[["項目", "合計"] + months]
-
-    for i, row in df_display.iterrows():
-        row_label = row["項目"]
-        for col in df_display.columns[1:]:
-            df_display.at[i, col] = format_val(row[col], row_label)
+    df = add_ratio_rows(df)
 
     # --- 目標比率取得（※未設定や「事業本部」の場合は空にするエラー回避） ---
-    target = get_expense_target_by_top_category(selected_div)
+    target = get_expense_target_map().get(selected_div)
     if target:
         targets = {
             "原価率": target.get("cost_rate", 0),
@@ -249,35 +154,9 @@ def show_dashboard_excluding_tax():
     else:
         targets = {}
 
-    # --- 表示用変換 ---
-    def format_val(val, row_label):
-        try:
-            if isinstance(val, (int, float)):
-                if "率" in str(row_label) and "税率" not in str(row_label):
-                    actual_pct = val * 100
-                    base_str = f"{actual_pct:.1f}%"
-                    
-                    # 目標比率との差分を計算して追加（HTMLの改行を使用）
-                    if row_label in targets and targets[row_label] > 0:
-                        diff = actual_pct - targets[row_label]
-                        sign = "+" if diff > 0 else ""
-                        return f"{base_str}<br><span style='font-size: 0.85em; color: gray;'>({sign}{diff:.1f}%)</span>"
-                    
-                    return base_str
-                return f"¥{val:,.0f}"
-        except:
-            pass
-        return val
-
-    df_display = df.copy()
-    df_display["項目"] = df_display.index
-    df_display = df_display[["項目", "合計"] + months]
-
-    for i, row in df_display.iterrows():
-        row_label = row["項目"]
-        for col in df_display.columns[1:]:
-            df_display.at[i, col] = format_val(row[col], row_label)
+    # --- 表示用変換（文字列と赤字フラグを列単位でまとめて作成） ---
+    pl_text, pl_red = format_pl_table(df, targets)
 
     # --- 表示 ---
     st.markdown("### 月別PL")
-    render_pl_table(df_display, targets)
\ No newline at end of file
+    render_pl_table(pl_text, pl_red)
\ No newline at end of file
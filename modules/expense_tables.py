@@ -4,25 +4,52 @@ import streamlit as st
 import pandas as pd
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 from db.account_items import get_account_items
-from db.all_expense import get_expenses, add_expense, delete_expense, update_expense_totals_by_category
-from db.all_expense_depreciation import get_expenses_depreciation, add_expense_depreciation, delete_expense_depreciation, update_expense_totals_depreciation_by_category
+from db.all_expense import get_expenses, add_expenses_bulk, update_expenses_bulk, delete_expenses_bulk
+from db.all_expense_depreciation import get_expenses_depreciation, add_expenses_depreciation_bulk, update_expenses_depreciation_bulk, delete_expenses_depreciation_bulk
 from db.default_partners import get_default_partners_by_category
-from db.supabase_client import supabase
 from db.expense_categories import get_expense_categories
+from modules.grid_diff import diff_grid
+from modules.monthly_state import state_key, load_cached, patch_cached, month_writes, merge_rows, shift_totals
+
+# 変更検出で比較するグリッドの列
+GRID_FIELDS = ["取引先", "勘定項目", "詳細", "支払方法", "金額"]
 
 # ✅ すべての費目カテゴリを対象に表示
 
-def show_expense_tables_by_select(year: int, month: int, top_category: str):
+def show_expense_tables_by_select(year: int, month: int, top_category: str, version: int = None):
     st.markdown("### 出金カテゴリを選択")
 
     # --- 変動費カテゴリ一覧を取得 ---
     second_categories = get_expense_categories()
     selected_category = st.selectbox("費目カテゴリを選択", second_categories, key=f"select_{top_category}")
 
-    show_single_expense_table(year, month, selected_category, top_category)
+    show_single_expense_table(year, month, selected_category, top_category, version)
+
+
+def _patch_saved_expenses(year: int, month: int, second_category: str, top_category: str, existing: list,
+                          versions: list, inserted=(), updated=(), deleted=()):
+    """
+    保存結果の行でセッション内の出金明細・出金集計を差し替え、書き込んだ版を記録する
+    versions: 書き込み順の一括書き込みの版（出金・減価償却の両方）。
+    間に他の書き込みがあった・書き込み結果が揃っていない場合は差し替えず、次回に読み直す
+    """
+    writes = month_writes((top_category, year, month), *versions)
+    if any("id" not in row for row in [*inserted, *updated, *deleted]):
+        writes = None
+    updated_ids = {row["id"] for row in updated}
+    old_rows = [row for row in existing if row["id"] in updated_ids]
+
+    def patch_totals(totals):
+        # 表示中の明細はすべて選択中の費目
+        totals = shift_totals(totals, [*deleted, *old_rows], lambda row: second_category, "cost", -1)
+        return shift_totals(totals, [*inserted, *updated], lambda row: second_category, "cost", 1)
+
+    patch_cached(state_key("expense_rows", year, month, top_category, second_category), writes,
+                 lambda rows: merge_rows(rows, inserted, updated, deleted))
+    patch_cached(state_key("expense_totals", year, month, top_category), writes, patch_totals)
 
 
-def show_single_expense_table(year: int, month: int, second_category: str, top_category: str):
+def show_single_expense_table(year: int, month: int, second_category: str, top_category: str, version: int = None):
     st.markdown(f"### {second_category}")
 
     key_prefix = f"aggrid_{second_category}_{top_category}".replace(" ", "_").replace("(", "").replace(")", "")
@@ -38,8 +65,10 @@ def show_single_expense_table(year: int, month: int, second_category: str, top_c
         st.session_state.pop(data_key, None)
         st.session_state[last_month_key] = current_key
 
-    # Supabaseから既存データ取得
-    existing = get_expenses(year, month, top_category)
+    # Supabaseから既存データ取得（選択中の費目だけをサーバー側で絞り込む）
+    # 版（version）が前回と同じなら、セッションに保存した明細をそのまま使う
+    existing = load_cached(state_key("expense_rows", year, month, top_category, second_category), version,
+                           lambda: get_expenses(year, month, top_category, second_category=second_category))
     existing_df = pd.DataFrame([
         {
             "id": row["id"],
@@ -50,7 +79,7 @@ def show_single_expense_table(year: int, month: int, second_category: str, top_c
             "金額": row["cost"],
             "操作": "（なし）"
         }
-        for row in existing if row["second_category"] == second_category and row["top_category"] == top_category
+        for row in existing
     ])
 
     # デフォルト行取得
@@ -106,40 +135,41 @@ def show_single_expense_table(year: int, month: int, second_category: str, top_c
         with col3a:
             if st.button("登録", key=f"register_{key_prefix}"):
 
-                # --- 登録対象抽出 ---
-                targets = []
-                for _, row in updated_df.iterrows():
+                # --- 登録対象抽出（id のない新規行から） ---
+                new_df, _, _, _ = diff_grid(updated_df, existing_df, GRID_FIELDS)
+                targets = [
+                    row for row in new_df.to_dict("records")
                     if (
-                        pd.isna(row.get("id")) and
                         str(row.get("取引先") or "").strip() and
                         row.get("勘定項目") != "選択してください" and
                         row.get("支払方法") != "選択してください"
-                    ):
-                        targets.append(row)
+                    )
+                ]
 
                 # --- 登録対象なし（ここで止めない！） ---
                 if not targets:
                     st.warning("登録対象がありません")
                 else:
+                    rows = [
+                        {
+                            "partner": row["取引先"],
+                            "account": row["勘定項目"],
+                            "detail": row["詳細"],
+                            "payment": row["支払方法"],
+                            "cost": row["金額"]
+                        }
+                        for row in targets
+                    ]
+
+                    # --- テーブルごとに1回の insert でまとめて登録 ---
+                    results_expense, versions_expense = add_expenses_bulk(year, month, rows, second_category, top_category)
+                    results_depreciation, versions_depreciation = add_expenses_depreciation_bulk(year, month, rows, second_category, top_category)
+
                     inserted = 0
                     failed_expense = 0
                     failed_depreciation = 0
 
-                    for row in targets:
-                        ok_expense = add_expense(
-                            year, month,
-                            row["取引先"], row["勘定項目"], row["詳細"],
-                            row["支払方法"], row["金額"],
-                            second_category, top_category
-                        )
-
-                        ok_depreciation = add_expense_depreciation(
-                            year, month,
-                            row["取引先"], row["勘定項目"], row["詳細"],
-                            row["支払方法"], row["金額"],
-                            second_category, top_category
-                        )
-
+                    for ok_expense, ok_depreciation in zip(results_expense, results_depreciation):
                         if ok_expense and ok_depreciation:
                             inserted += 1
                         else:
@@ -149,8 +179,9 @@ def show_single_expense_table(year: int, month: int, second_category: str, top_c
                                 failed_depreciation += 1
 
                     if inserted > 0:
-                        update_expense_totals_by_category(year, month, second_category, top_category)
-                        update_expense_totals_depreciation_by_category(year, month, second_category, top_category)
+                        _patch_saved_expenses(year, month, second_category, top_category, existing,
+                                              [versions_expense, versions_depreciation],
+                                              inserted=[row for row in results_expense if row])
                         st.success(f"{inserted} 件を登録しました")
                         st.session_state.pop(data_key, None)
                         st.rerun()
@@ -166,51 +197,54 @@ def show_single_expense_table(year: int, month: int, second_category: str, top_c
             if st.button("更新", key=f"update_{key_prefix}"):
                 updated = 0
                 deleted = 0
-                for _, row in updated_df.iterrows():
-                    if row["操作"] == "削除" and not pd.isna(row.get("id")):
-                        ok1 = delete_expense(int(row["id"]))
-                        ok2 = delete_expense_depreciation(int(row["id"]))
 
-                        if ok1 and ok2:
-                            deleted += 1
-                        else:
-                            st.error(f"id={int(row['id'])} の削除が失敗しました（expense={ok1}, depreciation={ok2}）")
-                    elif row["操作"] != "削除" and not pd.isna(row.get("id")):
-                        old = existing_df[existing_df["id"] == row["id"]]
-                        if not old.empty:
-                            ex = old.iloc[0]
-                            if any([
-                                row["取引先"] != ex["取引先"],
-                                row["勘定項目"] != ex["勘定項目"],
-                                row["詳細"] != ex["詳細"],
-                                row["支払方法"] != ex["支払方法"],
-                                row["金額"] != ex["金額"]
-                            ]):
-                                r1 = supabase.table("all_expense").update({
-                                    "partner": row["取引先"],
-                                    "account": row["勘定項目"],
-                                    "detail": row["詳細"],
-                                    "payment": row["支払方法"],
-                                    "cost": row["金額"]
-                                }).eq("id", int(row["id"])).execute()
-                                r2 = supabase.table("all_expense_depreciation").update({
-                                    "partner": row["取引先"],
-                                    "account": row["勘定項目"],
-                                    "detail": row["詳細"],
-                                    "payment": row["支払方法"],
-                                    "cost": row["金額"]
-                                }).eq("id", int(row["id"])).execute()
-                                ok1 = bool(getattr(r1, "data", None))
-                                ok2 = bool(getattr(r2, "data", None))
-
-                                if ok1 and ok2:
-                                    updated += 1
-                                else:
-                                    st.error(f"id={int(row['id'])} の更新が失敗しました（expense={ok1}, depreciation={ok2}）")
+                # --- 取得時の行と id で突き合わせ、変更行と削除行をまとめて抽出 ---
+                _, changed_df, delete_ids, _ = diff_grid(updated_df, existing_df, GRID_FIELDS)
+                changed_rows = [
+                    {
+                        "id": int(row["id"]),
+                        "year": year,
+                        "month": month,
+                        "partner": row["取引先"],
+                        "account": row["勘定項目"],
+                        "detail": row["詳細"],
+                        "payment": row["支払方法"],
+                        "cost": row["金額"],
+                        "second_category": second_category,
+                        "top_category": top_category
+                    }
+                    for row in changed_df.to_dict("records")
+                ]
+
+                # --- テーブルごとに1リクエストでまとめて削除・更新 ---
+                deleted_rows = []
+                updated_rows = []
+                versions = []
+                if delete_ids:
+                    deleted_rows, versions_expense = delete_expenses_bulk(delete_ids, (top_category, year, month))
+                    deleted_depreciation, versions_depreciation = delete_expenses_depreciation_bulk(delete_ids, (top_category, year, month))
+                    versions += [versions_expense, versions_depreciation]
+                    ok1 = deleted_rows is not None
+                    ok2 = deleted_depreciation is not None
+                    if ok1 and ok2:
+                        deleted = len(delete_ids)
+                    else:
+                        st.error(f"{len(delete_ids)} 件の削除が失敗しました（expense={ok1}, depreciation={ok2}）")
+
+                if changed_rows:
+                    updated_rows, versions_expense = update_expenses_bulk(changed_rows)
+                    updated_depreciation, versions_depreciation = update_expenses_depreciation_bulk(changed_rows)
+                    versions += [versions_expense, versions_depreciation]
+                    ok1 = updated_rows is not None
+                    ok2 = updated_depreciation is not None
+                    if ok1 and ok2:
+                        updated = len(changed_rows)
+                    else:
+                        st.error(f"{len(changed_rows)} 件の更新が失敗しました（expense={ok1}, depreciation={ok2}）")
 
                 if deleted or updated:
-                    update_expense_totals_by_category(year, month, second_category, top_category)
-                    update_expense_totals_depreciation_by_category(year, month, second_category, top_category)
+                    _patch_saved_expenses(year, month, second_category, top_category, existing, versions,
+                                          updated=updated_rows or [], deleted=deleted_rows or [])
                     if deleted: st.success(f"{deleted} 件を削除しました")
                     if updated: st.success(f"{updated} 件を更新しました")
                     st.session_state.pop(data_key, None)
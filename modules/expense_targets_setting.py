@@ -2,7 +2,7 @@
 
 import streamlit as st
 from db.divisions import get_divisions, get_division_records
-from db.expense_targets import get_expense_target_by_top_category, upsert_expense_target
+from db.expense_targets import get_expense_target_map, upsert_expense_target
 from datetime import datetime
 
 def handle_expense_targets_setting():
@@ -35,6 +35,9 @@ def handle_expense_targets_setting():
 
     all_entries = virtual_entries + divisions
 
+    # 全事業部の目標比率を一度に取得
+    target_map = get_expense_target_map()
+
     tabs = st.tabs(all_entries)
 
     for i, div in enumerate(all_entries):
@@ -47,7 +50,7 @@ def handle_expense_targets_setting():
                 label = div
             st.markdown(f"### 【{label}】の目標比率")
 
-            data = get_expense_target_by_top_category(div)
+            data = target_map.get(div)
             editing_key = f"{div}_editing"
 
             if not st.session_state.get(editing_key):
@@ -4,10 +4,10 @@ import streamlit as st
 from db.fixed_categories import (
     get_fixed_categories,
     save_fixed_category,
-    delete_fixed_category
+    update_fixed_categories_bulk,
+    delete_fixed_categories_bulk
 )
 from db.account_items import get_account_items
-from db.fixed_categories import update_fixed_category
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 import pandas as pd
 from db.divisions import get_divisions
@@ -129,20 +129,36 @@ def handle_fixed_expense_setting():
                 if st.button("一覧を更新する", key=f"update_button_{selected_top_category}"):
                     updated = 0
                     deleted = 0
+                    delete_ids = []
+                    edited_rows = []
                     for _, row in updated_df.iterrows():
                         id_ = int(row["id"])
                         action = row["操作"]
                         if action == "削除":
-                            delete_fixed_category(id_)
-                            deleted += 1
+                            delete_ids.append(id_)
                         elif action == "編集":
-                            update_fixed_category(id_, "partner", row["支払先"])
-                            update_fixed_category(id_, "second_category", row["費目"])
-                            update_fixed_category(id_, "account", row["勘定科目"])
-                            update_fixed_category(id_, "detail", row["詳細"])
-                            update_fixed_category(id_, "payment", row["支払方法"])
-                            update_fixed_category(id_, "cost", str(row["金額"]))
-                            updated += 1
+                            edited_rows.append({
+                                "id": id_,
+                                "partner": row["支払先"],
+                                "second_category": row["費目"],
+                                "account": row["勘定科目"],
+                                "detail": row["詳細"],
+                                "payment": row["支払方法"],
+                                "cost": str(row["金額"]),
+                                "top_category": selected_top_category
+                            })
+
+                    # --- 1リクエストでまとめて削除・更新 ---
+                    if delete_ids:
+                        if delete_fixed_categories_bulk(delete_ids):
+                            deleted = len(delete_ids)
+                        else:
+                            st.error("削除に失敗しました")
+                    if edited_rows:
+                        if update_fixed_categories_bulk(edited_rows):
+                            updated = len(edited_rows)
+                        else:
+                            st.error("更新に失敗しました")
 
                     if updated > 0:
                         st.success(f"{updated} 件を更新しました")
@@ -2,13 +2,15 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from datetime import datetime
 from db.all_sales_total import get_sales_totals_all
 from db.all_expense_total import get_expense_totals_all
-from db.expense_targets import get_expense_target_by_top_category
+from db.expense_targets import get_expense_targets
 from db.expense_categories import get_expense_categories
 from db.divisions import get_divisions, get_division_records
+from db.periods import years_in_periods
 
 # --- 期間オプションから日付範囲を返す ---
 def get_filtered_period(option: str):
@@ -30,10 +32,57 @@ def get_filtered_period(option: str):
 
     return start, end
 
-# --- 年月フィルター ---
-def ym_filter(df, start: datetime, end: datetime):
-    df["年月日"] = pd.to_datetime(df["year"].astype(str) + "-" + df["month"].astype(str).str.zfill(2) + "-01")
-    return df[(df["年月日"] >= start) & (df["年月日"] <= end)]
+# --- 長期間表示の切り替え基準 ---
+QUARTERLY_MONTHS = 24   # 表示月数がこれを超えると四半期単位に集計し、数値ラベルを省略
+WEBGL_POINTS = 500      # 1つの図の点数（四半期集計前の 月数 × 費目数 × 実績/目標）がこれを超えると WebGL で描画
+
+# --- 期間キー（year*100+month）と表示用ラベルを読み込み時に一度だけ付与 ---
+def add_period_columns(df: pd.DataFrame, quarterly: bool = False) -> pd.DataFrame:
+    df["period"] = df["year"].astype(int) * 100 + df["month"].astype(int)
+    periods = np.sort(df["period"].unique())
+    if quarterly:
+        labels = [f"{p // 100} / Q{(p % 100 - 1) // 3 + 1}" for p in periods]
+    else:
+        labels = [f"{p // 100} / {p % 100:02d}" for p in periods]
+    # 四半期の場合は同じラベルの月がまとまり、後段の groupby で合算される
+    label_index = pd.Index(labels)
+    categories = label_index.unique()
+    codes = categories.get_indexer(label_index)
+    df["年月"] = pd.Categorical.from_codes(codes[np.searchsorted(periods, df["period"])], categories=categories, ordered=True)
+    return df
+
+# --- 日付範囲を期間キーの範囲に変換（月初日が範囲内の月を対象とする） ---
+def period_bounds(start: datetime, end: datetime) -> tuple:
+    first = start.year * 100 + start.month
+    if start > datetime(start.year, start.month, 1):
+        first = first + 1 if start.month < 12 else (start.year + 1) * 100 + 1
+    return first, end.year * 100 + end.month
+
+# --- 期間キーの範囲に含まれる月数 ---
+def count_months(start_period: int, end_period: int) -> int:
+    return (end_period // 100 - start_period // 100) * 12 + end_period % 100 - start_period % 100 + 1
+
+# --- 目標比率テーブルの列 → グラフの費目 ---
+CHART_TARGET_COLUMNS = {
+    "原価（仕入れ高）": "cost_rate",
+    "人件費": "labor_rate",
+    "FL比率": "fl_rate",
+    "水道光熱費": "utility_rate",
+    "消耗品費・その他諸経費": "misc_rate",
+    "その他固定費": "other_fixed_rate",
+    "家賃": "rent_rate",
+    "営業利益": "op_profit_rate",
+}
+
+# --- 全事業部の目標率を {top_category: {費目: 目標率（%→小数）}} に変換 ---
+def build_target_rates(targets: list) -> dict:
+    return {
+        row["top_category"]: {
+            category: (row.get(column) or 0) / 100
+            for category, column in CHART_TARGET_COLUMNS.items()
+        }
+        for row in targets
+    }
 
 # --- メイン表示関数 ---
 def show_graph_analysis():
@@ -46,8 +95,10 @@ def show_graph_analysis():
     # データ取得
     division_records = get_division_records()
     divisions = [r["name"] for r in division_records]
-    sales_data = get_sales_totals_all(list(range(start_date.year - 1, end_date.year + 1)))
-    expense_data = get_expense_totals_all(list(range(start_date.year - 1, end_date.year + 1)))
+    periods = period_bounds(start_date, end_date)
+    years = years_in_periods(*periods)
+    sales_data = get_sales_totals_all(years, periods)
+    expense_data = get_expense_totals_all(years, periods)
 
     df_sales = pd.DataFrame(sales_data)
     df_expense = pd.DataFrame(expense_data)
@@ -56,9 +107,10 @@ def show_graph_analysis():
         st.warning("データが存在しません。")
         return
 
-    # 年月整形（YYYY / MM）
-    df_sales["年月"] = df_sales["year"].astype(str) + " / " + df_sales["month"].astype(str).str.zfill(2)
-    df_expense["年月"] = df_expense["year"].astype(str) + " / " + df_expense["month"].astype(str).str.zfill(2)
+    # 期間キーと年月ラベル（YYYY / MM、長期間は YYYY / Qn）
+    quarterly = count_months(*periods) > QUARTERLY_MONTHS
+    df_sales = add_period_columns(df_sales, quarterly)
+    df_expense = add_period_columns(df_expense, quarterly)
 
     # 業態・ブランドのグループを構築
     type_groups = {}
@@ -87,88 +139,76 @@ def show_graph_analysis():
 
     all_entries = virtual_entries + divisions
 
-    def get_target_divisions(entry_name):
-        return virtual_div_map.get(entry_name, [entry_name])
-
-    tabs = st.tabs(all_entries)
-
-    for div_name, tab in zip(all_entries, tabs):
-        with tab:
-            target_divs = get_target_divisions(div_name)
-
-            # --- 売上データ ---
-            df_sales_div = df_sales[df_sales["top_category"].isin(target_divs)].copy()
-            df_sales_div = ym_filter(df_sales_div, start_date, end_date)
-            df_sales_grouped = df_sales_div.groupby("年月")["total_amount"].sum().reset_index()
-
-            if not df_sales_grouped.empty:
-                st.markdown(f"### 売上推移")
-                fig1 = px.bar(df_sales_grouped, x="年月", y="total_amount", title="月次売上",
-                              labels={"total_amount": "売上金額"}, text_auto=True)
-                fig1.update_layout(
-                    yaxis=dict(tickformat=",", tickprefix="¥", separatethousands=True)
-                )
-                st.plotly_chart(fig1, use_container_width=True, key=f"{div_name}_sales")
-            else:
-                st.info("該当期間の売上データがありません。")
-
-            # --- 支出データ（個別カテゴリ折れ線＋目標） ---
-            df_expense_div = df_expense[df_expense["top_category"].isin(target_divs)].copy()
-            df_expense_div = ym_filter(df_expense_div, start_date, end_date)
-            df_expense_grouped = df_expense_div.groupby(["年月", "second_category"])["total_cost"].sum().reset_index()
-
-            if not df_expense_grouped.empty:
-                st.markdown(f"### 費目別支出推移")
-
-                # ✅ 表示順：expense_categoriesテーブルの順
-                category_order = get_expense_categories()
-
-                # ✅ 目標率を取得
-                target_row = get_expense_target_by_top_category(div_name)
-                if target_row:
-                    target_map = {
-                        "原価（仕入れ高）": target_row.get("cost_rate", 0),
-                        "人件費": target_row.get("labor_rate", 0),
-                        "FL比率": target_row.get("fl_rate", 0),
-                        "水道光熱費": target_row.get("utility_rate", 0),
-                        "消耗品費・その他諸経費": target_row.get("misc_rate", 0),
-                        "その他固定費": target_row.get("other_fixed_rate", 0),
-                        "家賃": target_row.get("rent_rate", 0),
-                        "営業利益": target_row.get("op_profit_rate", 0)
-                    }
-                else:
-                    target_map = {}
-
-                # ✅ 月別売上を辞書化（目標額算出用）
-                sales_lookup = dict(zip(df_sales_grouped["年月"], df_sales_grouped["total_amount"]))
-
-                for category in category_order:
-                    if category not in df_expense_grouped["second_category"].unique():
-                        continue  # データなしカテゴリはスキップ
-
-                    df_cat = df_expense_grouped[df_expense_grouped["second_category"] == category].copy()
-
-                    # ✅ 目標額を計算（%→小数に直すため /100）
-                    target_rate = target_map.get(category, 0) / 100
-                    df_cat["目標額"] = df_cat["年月"].map(lambda ym: sales_lookup.get(ym, 0) * target_rate)
-
-                    fig = px.line(df_cat, x="年月", y="total_cost", markers=True,
-                                  title=f"{category} の支出推移",
-                                  labels={"total_cost": "支出金額"})
-                    fig.update_traces(name="実績", line=dict(color="blue"))
-
-                    # ✅ 赤点線で目標額表示
-                    fig.add_scatter(x=df_cat["年月"], y=df_cat["目標額"], mode="lines+markers",
-                                    name="目標額", line=dict(color="red", dash="dot"))
-
-                    fig.update_layout(
-                        yaxis=dict(
-                            tickformat=",",
-                            tickprefix="¥",
-                            separatethousands=True
-                        )
-                    )
-                    fig.update_yaxes(range=[0, max(df_cat["total_cost"].max(), df_cat["目標額"].max()) * 1.1])
-                    st.plotly_chart(fig, use_container_width=True, key=f"{div_name}_{category}_expense")
-            else:
-                st.info("該当期間の支出データがありません。")
+    # 費目の表示順（expense_categoriesテーブルの順）と目標率は1回だけ取得
+    category_order = get_expense_categories()
+    target_rates = build_target_rates(get_expense_targets())
+
+    # 選択中のエントリだけを描画（切り替え時はグラフ部分のみ再実行）
+    show_entry_graphs(all_entries, virtual_div_map, df_sales, df_expense, periods, category_order, target_rates, quarterly)
+
+# --- 選択された事業部・合計エントリのグラフ表示 ---
+@st.fragment
+def show_entry_graphs(entries: list, virtual_div_map: dict, df_sales: pd.DataFrame, df_expense: pd.DataFrame,
+                      periods: tuple, category_order: list, target_rates: dict, quarterly: bool = False):
+    div_name = st.selectbox("事業部・店舗を選択", entries)
+    target_divs = virtual_div_map.get(div_name, [div_name])
+
+    # --- 売上データ ---
+    df_sales_div = df_sales[df_sales["top_category"].isin(target_divs) & df_sales["period"].between(*periods)]
+    df_sales_grouped = df_sales_div.groupby("年月", observed=True)["total_amount"].sum().reset_index()
+
+    if not df_sales_grouped.empty:
+        st.markdown(f"### 売上推移")
+        fig1 = px.bar(df_sales_grouped, x="年月", y="total_amount", title="四半期売上" if quarterly else "月次売上",
+                      labels={"total_amount": "売上金額", "年月": "四半期" if quarterly else "年月"},
+                      text_auto=not quarterly)
+        fig1.update_layout(
+            yaxis=dict(tickformat=",", tickprefix="¥", separatethousands=True)
+        )
+        st.plotly_chart(fig1, use_container_width=True, key=f"{div_name}_sales")
+    else:
+        st.info("該当期間の売上データがありません。")
+
+    # --- 支出データ（個別カテゴリ折れ線＋目標） ---
+    df_expense_div = df_expense[df_expense["top_category"].isin(target_divs) & df_expense["period"].between(*periods)]
+    df_expense_grouped = df_expense_div.groupby(["年月", "second_category"], observed=True)["total_cost"].sum().reset_index()
+
+    if not df_expense_grouped.empty:
+        st.markdown(f"### 費目別支出推移")
+
+        # ✅ 目標率（小数）
+        target_map = target_rates.get(div_name, {})
+
+        # ✅ 実績と目標額（月次売上 × 目標率）を1つの表にまとめる（データなしカテゴリは含めない）
+        sales_lookup = dict(zip(df_sales_grouped["年月"].astype(str), df_sales_grouped["total_amount"]))
+        df_chart = df_expense_grouped[df_expense_grouped["second_category"].isin(category_order)]
+        df_chart = df_chart.assign(
+            実績=df_chart["total_cost"],
+            目標額=df_chart["年月"].astype(str).map(sales_lookup).fillna(0)
+                * df_chart["second_category"].map(target_map).fillna(0.0)
+        )
+        categories = [c for c in category_order if c in set(df_chart["second_category"])]
+
+        if categories:
+            df_long = df_chart.melt(id_vars=["年月", "second_category"], value_vars=["実績", "目標額"],
+                                    var_name="系列", value_name="金額")
+            # 四半期集計後の点数ではなく、表示期間の月数で判定する（長期間ほど WebGL に切り替わる）
+            webgl = count_months(*periods) * len(categories) * 2 > WEBGL_POINTS
+
+            # ✅ 費目ごとの小グラフを縦に並べた1つの図（実績は青線、目標額は赤点線）
+            fig = px.line(df_long, x="年月", y="金額", color="系列", line_dash="系列", markers=True,
+                          facet_col="second_category", facet_col_wrap=1,
+                          facet_row_spacing=min(0.08, 0.5 / len(categories)),
+                          category_orders={"second_category": categories, "系列": ["実績", "目標額"]},
+                          color_discrete_map={"実績": "blue", "目標額": "red"},
+                          line_dash_map={"実績": "solid", "目標額": "dot"},
+                          labels={"金額": "支出金額", "系列": "", "年月": "四半期" if quarterly else "年月"},
+                          render_mode="webgl" if webgl else "svg",
+                          height=320 * len(categories))
+            fig.for_each_annotation(lambda a: a.update(text=f"{a.text.split('=', 1)[-1]} の支出推移"))
+            fig.update_xaxes(showticklabels=True)
+            fig.update_yaxes(matches=None, showticklabels=True, rangemode="tozero",
+                             tickformat=",", tickprefix="¥", separatethousands=True)
+            st.plotly_chart(fig, use_container_width=True, key=f"{div_name}_expense")
+    else:
+        st.info("該当期間の支出データがありません。")
@@ -0,0 +1,45 @@
+# modules/grid_diff.py
+
+import pandas as pd
+
+# 「操作」列で削除を指定する値
+DELETE_OPERATION = "削除"
+
+
+def diff_grid(edited: pd.DataFrame, original: pd.DataFrame, fields: list, operation_column: str = "操作") -> tuple:
+    """
+    編集後のグリッドと取得時の行（original）を id で1回だけ突き合わせ、登録・更新・削除に振り分ける。
+    返り値は (inserted, updated, deleted_ids, changed)
+      inserted: id のない行（新規行。id 列自体がない場合は全行）
+      updated: fields のいずれかが取得時から変わった既存行（編集後の値、id は float）
+      deleted_ids: 操作列が「削除」の既存行の id リスト
+      changed: updated と同じ行の、fields 列ごとの変更有無（bool の DataFrame）
+    比較は列単位の配列演算で行い、両方とも欠損の値は変更なしとみなす。
+    """
+    if edited.empty:
+        empty = edited.iloc[0:0]
+        return empty, empty, [], pd.DataFrame(columns=fields, dtype=bool)
+    if "id" not in edited.columns:
+        # id 列がない場合はすべて新規行
+        return edited, edited.iloc[0:0], [], pd.DataFrame(columns=fields, dtype=bool)
+
+    ids = pd.to_numeric(edited["id"], errors="coerce")
+    has_id = ids.notna()
+    delete = edited[operation_column] == DELETE_OPERATION
+
+    inserted = edited[~has_id]
+    deleted_ids = ids[has_id & delete].astype(int).tolist()
+    kept = edited[has_id & ~delete].assign(id=ids[has_id & ~delete])
+
+    if kept.empty or original.empty:
+        return inserted, kept.iloc[0:0], deleted_ids, pd.DataFrame(columns=fields, dtype=bool)
+
+    # 取得時の値を id で横に並べ、列ごとの変更マスクを作る
+    base = original[["id"] + fields].assign(id=pd.to_numeric(original["id"])).drop_duplicates("id")
+    merged = kept.merge(base, on="id", how="inner", suffixes=("", "_orig"))
+    new = merged[fields]
+    old = merged[[f"{field}_orig" for field in fields]].set_axis(fields, axis=1)
+    changed = new.ne(old) & ~(new.isna() & old.isna())
+
+    rows = changed.any(axis=1)
+    return inserted, merged.loc[rows, list(kept.columns)], deleted_ids, changed[rows]
@@ -1,5 +1,6 @@
 # modules/header.py
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -166,7 +167,52 @@ def render_styled_table(data: dict):
         unsafe_allow_html=True
     )
 
-def render_pl_table(df: pd.DataFrame, targets: dict = {}):
+def format_pl_table(df: pd.DataFrame, targets: dict = {}) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    数値のPL（行=項目, 列=合計+年月）から、表示用文字列と赤字フラグを列単位でまとめて作る
+    - 比率行（「率」を含み「税率」を含まない行）は % 表示。目標があれば差分を併記し、未達・超過を赤字
+    - 金額行は ¥ 表示。マイナスを赤字
+    """
+    labels = df.index.to_series()
+    is_rate = labels.str.contains("率") & ~labels.str.contains("税率")
+    thresholds = labels.map(lambda label: float(targets.get(label) or 0))
+    has_target = is_rate & (thresholds > 0)
+
+    values = df.astype(float)
+    text = pd.DataFrame("", index=df.index, columns=df.columns, dtype=object)
+    red = pd.DataFrame(False, index=df.index, columns=df.columns)
+
+    # --- 金額行 ---
+    amounts = values[~is_rate]
+    text.loc[~is_rate] = amounts.map("¥{:,.0f}".format)
+    red.loc[~is_rate] = amounts.round() < 0
+
+    # --- 比率行 ---
+    pct = values[is_rate] * 100
+    text.loc[is_rate] = pct.map("{:.1f}%".format)
+
+    # --- 目標比率との差分と判定（利益率は下回ったら、コスト率は上回ったら赤字） ---
+    if has_target.any():
+        target_pct = pct[has_target[is_rate]]
+        threshold = thresholds[has_target]
+        diff = target_pct.sub(threshold, axis=0)
+        sign = pd.DataFrame(np.where(diff > 0, "+", ""), index=diff.index, columns=diff.columns)
+        text.loc[has_target] = (
+            text.loc[has_target]
+            + "<br><span style='font-size: 0.85em; color: gray;'>("
+            + sign + diff.map("{:.1f}".format) + "%)</span>"
+        )
+
+        rounded = target_pct.round(1)
+        is_profit = labels[has_target].str.contains("利益率")
+        over = rounded.gt(threshold, axis=0)
+        under = rounded.lt(threshold, axis=0)
+        red.loc[has_target] = under.where(is_profit, over, axis=0)
+
+    return text, red
+
+def render_pl_table(text: pd.DataFrame, red: pd.DataFrame):
+    """format_pl_table の表示用文字列と赤字フラグからPL表を描画"""
     def css_class(row_label):
         if row_label in ["総売上", "実質営業利益", "実質営業利益率", "最終営業利益", "最終営業利益率"]:
             return "blue-bg bold"
@@ -177,49 +223,12 @@ def render_pl_table(df: pd.DataFrame, targets: dict = {}):
             return ""
 
     # --- HTML化 ---
-    rows_html = []
-    for _, row in df.iterrows():
-        row_label = row["項目"]
-        row_css = css_class(row_label)
-        row_html = f'<tr class="{row_css}"><td>{row_label}</td>'
-
-        for col in df.columns[1:]:
-            val = row[col]
-            style = ""
-
-            # 🔴 比率が目標未達 または 超過で赤文字
-            if row_label in targets and isinstance(val, str) and "%" in val:
-                try:
-                    # 改行タグを取り除き、実績の%部分だけを抽出
-                    base_val = val.split("<br>")[0] 
-                    pct_val = float(base_val.replace("%", "").replace(",", ""))
-                    
-                    threshold = targets[row_label]
-                    if threshold > 0:
-                        # 利益率（実質営業利益率など）は、目標を下回った場合に赤字
-                        if "利益率" in row_label:
-                            if pct_val < threshold:
-                                style = ' style="color:red;"'
-                        # それ以外のコスト（原価率など）は、目標を上回った場合に赤字
-                        else:
-                            if pct_val > threshold:
-                                style = ' style="color:red;"'
-                except:
-                    pass
-
-            # 🔴 金額がマイナス
-            elif isinstance(val, str) and "¥" in val:
-                try:
-                    amount = int(val.replace("¥", "").replace(",", ""))
-                    if amount < 0:
-                        style = ' style="color:red;"'
-                except:
-                    pass
-
-            row_html += f'<td{style}>{val}</td>'
-
-        row_html += '</tr>'
-        rows_html.append(row_html)
+    styles = np.where(red, ' style="color:red;"', "")
+    cells = "<td" + styles + ">" + text + "</td>"
+    rows_html = [
+        f'<tr class="{css_class(row_label)}"><td>{row_label}</td>' + "".join(row_cells) + "</tr>"
+        for row_label, row_cells in zip(cells.index, cells.to_numpy())
+    ]
 
     table_html = f"""
     <div style="overflow-x: auto;">
@@ -265,7 +274,7 @@ def render_pl_table(df: pd.DataFrame, targets: dict = {}):
     </style>
     <table>
         <thead><tr><th>項目</th>""" + "".join(
-        [f"<th>{col}</th>" for col in df.columns[1:]]
+        [f"<th>{col}</th>" for col in text.columns]
     ) + "</tr></thead><tbody>" + "".join(rows_html) + "</tbody></table></div>"
 
     st.markdown(table_html, unsafe_allow_html=True)
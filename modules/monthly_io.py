@@ -7,13 +7,15 @@ from modules.header import render_styled_table
 from db.all_expense_total import get_expense_totals
 from modules.expense_tables import show_expense_tables_by_select
 from db.fixed_categories import apply_fixed_expenses
-from db.all_expense import update_expense_totals_by_category
-from db.all_expense_depreciation import update_expense_totals_depreciation_by_category
+from db.all_expense import update_expense_month_totals
+from db.all_expense_depreciation import update_expense_month_totals_depreciation
 from db.divisions import get_divisions
-from db.expense_categories import get_fixed_expense_categories, get_variable_expense_categories
+from db.expense_categories import get_expense_category_groups
 from modules.sales_tables import show_all_sales_tables
 from db.all_sales import get_sales
-from db.all_sales_total import get_sales_totals
+from db.all_sales_total import get_sales_totals_by_rate
+from db.data_versions import get_data_version
+from modules.monthly_state import state_key, load_cached
 
 # --- 年度・月管理ユーティリティ ---
 def generate_terms(start_year=2020):
@@ -45,9 +47,14 @@ def get_months_in_term(term):
 def handle_all_income(year: int, month: int, top_category: str):
     st.markdown("<h3 class='nyukin-h3'>入金集計</h3>", unsafe_allow_html=True)
 
+    # 版が前回と同じなら、集計・明細はセッションに保存した値を使う
+    version = get_data_version(top_category, year, month)
+
     # tax_rateごとに合計を取得
     tax_rates = ["売上10%", "売上8%", "その他売上10%", "その他売上8%"]
-    totals = {rate: get_sales_totals(year, month, top_category, rate) for rate in tax_rates}
+    totals_by_rate = load_cached(state_key("sales_totals", year, month, top_category), version,
+                                 lambda: get_sales_totals_by_rate(year, month, top_category))
+    totals = {rate: totals_by_rate.get(rate, 0.0) for rate in tax_rates}
 
     # 全体合計も計算
     total_amount = sum(totals.values())
@@ -60,17 +67,19 @@ def handle_all_income(year: int, month: int, top_category: str):
         st.info("この月の入金データがまだ登録されていません。")
 
     # 入金入力テーブルを表示
-    show_all_sales_tables(year, month, top_category)
+    show_all_sales_tables(year, month, top_category, version)
 
 # --- 出金管理 ---
 def handle_all_expense(year: int, month: int, top_category: str):
     st.markdown("<h3 class='syukkin-h3'>出金集計</h3>", unsafe_allow_html=True)
 
-    totals = get_expense_totals(year, month, top_category)
+    # 版が前回と同じなら、集計・明細はセッションに保存した値を使う
+    version = get_data_version(top_category, year, month)
+    totals = load_cached(state_key("expense_totals", year, month, top_category), version,
+                         lambda: get_expense_totals(year, month, top_category))
 
-    # カテゴリ一覧をDBから取得
-    variable_categories = get_variable_expense_categories()
-    fixed_categories = get_fixed_expense_categories()
+    # カテゴリ一覧をDBから取得（変動費・固定費をまとめて）
+    variable_categories, fixed_categories = get_expense_category_groups()
 
     if totals:
         variable_summary = {}
@@ -102,16 +111,17 @@ def handle_all_expense(year: int, month: int, top_category: str):
         st.info("この月の出金データがまだ登録されていません。")
 
     # 出金入力テーブルを表示
-    show_expense_tables_by_select(year, month, top_category)
+    show_expense_tables_by_select(year, month, top_category, version)
 
     # 固定費手動反映ボタン
     if st.button("この月に固定費を反映する", key=f"apply_fixed_{year}_{month}_{top_category}"):
         success, failed_expense, failed_depreciation = apply_fixed_expenses(year, month, top_category)
         if success:
-            for second_category in fixed_categories:
-                update_expense_totals_by_category(year, month, second_category, top_category)
-                update_expense_totals_depreciation_by_category(year, month, second_category, top_category)
+            # 両台帳の合計を月単位でまとめて再集計（固定費の費目が固定費カテゴリ以外でも反映される）
+            update_expense_month_totals(year, month, top_category)
+            update_expense_month_totals_depreciation(year, month, top_category)
 
+            for second_category in fixed_categories:
                 # 👇 表示キャッシュを破棄（AgGridを再表示させる）
                 key_prefix = second_category.replace(" ", "_").replace("(", "").replace(")", "")
                 st.session_state.pop(f"{key_prefix}_{top_category}_table_data", None)
@@ -138,8 +148,8 @@ def handle_all_expense(year: int, month: int, top_category: str):
         if not st.session_state.get(key):
             success = apply_fixed_expenses(year, month, top_category)
             if success:
-                for second_category in fixed_categories:
-                    update_expense_totals_by_category(year, month, second_category, top_category)
+                update_expense_month_totals(year, month, top_category)
+                update_expense_month_totals_depreciation(year, month, top_category)
                 st.success("固定費を月末に自動反映しました。")
             st.session_state[key] = True
 
@@ -0,0 +1,76 @@
+# modules/monthly_state.py
+
+import streamlit as st
+
+# 月別入出金画面のセッション内キャッシュ
+# 明細行・集計を (top_category, year, month) の data_versions の版と一緒に session_state に保存し、
+# 版が変わらない限り再実行時に台帳・合計テーブルを読み直さない。
+# 自分の保存後は、保存済みの版から自分の書き込みの版まで途切れずにつながる場合だけ、
+# 書き込み結果の行で保存済みの値を差し替えて自分が書き込んだ版を記録する。
+
+
+def state_key(kind: str, year: int, month: int, top_category: str, *parts) -> str:
+    """セッション内キャッシュのキー（kind: sales_rows / sales_totals / expense_rows / expense_totals）"""
+    return "_".join(["monthly", kind, top_category, str(year), f"{month:02d}", *map(str, parts)])
+
+
+def load_cached(key: str, version, fetch):
+    """
+    session_state[key] に保存した値を、版が同じなら読み直さずに返す
+    未保存・版が変わった・版が取れなかった（None）場合は fetch() で取得して保存する
+    """
+    entry = st.session_state.get(key)
+    if version is not None and entry is not None and entry["version"] == version:
+        return entry["value"]
+    value = fetch()
+    st.session_state[key] = {"version": version, "value": value}
+    return value
+
+
+def month_writes(month_key: tuple, *results) -> list | None:
+    """
+    一括書き込みが返した版（{(top_category, year, month): (書き込み前の版, 書き込んだ版)}）を書き込み順に受け取り、
+    対象月の [(書き込み前の版, 書き込んだ版), ...] を返す（版が返らなかった書き込みがあれば None）
+    """
+    writes = []
+    for versions in results:
+        if not versions or month_key not in versions:
+            return None
+        writes.append(versions[month_key])
+    return writes
+
+
+def patch_cached(key: str, writes, patch) -> None:
+    """
+    保存済みの値を patch(value) で書き換え、最後に書き込んだ版で保存し直す（未保存なら何もしない）
+    writes（month_writes の結果）の書き込み前の版が、保存済みの版・直前に書き込んだ版と順につながらない場合は
+    自分の書き込みの間に他の書き込みがあったため、保存済みの値を捨てて次回に読み直す（writes が None の場合も同じ）
+    自分の書き込みの後に他の書き込みがあった場合は、記録した版が最新の版と違うため load_cached が読み直す
+    """
+    entry = st.session_state.get(key)
+    if entry is None:
+        return
+    version = entry["version"]
+    for previous, written in writes or ():
+        version = written if version is not None and previous == version else None
+    if not writes or version is None:
+        st.session_state.pop(key, None)
+        return
+    st.session_state[key] = {"version": version, "value": patch(entry["value"])}
+
+
+def merge_rows(rows: list, inserted=(), updated=(), deleted=()) -> list:
+    """明細行のリストに書き込み結果の行（追加・更新・削除）を反映し、id 順で返す"""
+    replaced = {row["id"] for row in updated} | {row["id"] for row in deleted}
+    merged = [row for row in rows if row["id"] not in replaced] + list(updated) + list(inserted)
+    return sorted(merged, key=lambda row: row["id"])
+
+
+def shift_totals(totals: dict, rows, group_of, amount_column: str, sign: int) -> dict:
+    """集計 {グループ: 金額} に明細行の金額を符号付きで加減した辞書を返す（group_of: 行 → グループ）"""
+    totals = dict(totals)
+    for row in rows:
+        group = group_of(row)
+        if group is not None:
+            totals[group] = totals.get(group, 0) + sign * (row.get(amount_column) or 0)
+    return totals
@@ -0,0 +1,167 @@
+# modules/pl_engine.py
+
+import pandas as pd
+from db.pl_lines import SALES_LINES, EXPENSE_LINES, PL_COLUMNS
+
+# --- 税抜モードで割り戻す行と税率 ---
+TAX_FACTORS = {
+    "売上（税率10%）": 1.1,
+    "売上（税率8%）": 1.08,
+    "その他売上（税率10%）": 1.1,
+    "その他売上（税率8%）": 1.08,
+    "原価": 1.08,
+    "水道光熱費": 1.1,
+    "消耗品費・その他諸経費": 1.1,
+    "その他固定費": 1.1,
+    "家賃": 1.1,
+    "広告費": 1.1,
+    "臨時諸経費": 1.1,
+}
+
+# --- PLの行順 ---
+PL_ROWS = [
+    "売上（税率10%）", "売上（税率8%）", "その他売上（税率10%）", "その他売上（税率8%）",
+    "総売上", "原価", "売上総利益", "人件費", "源泉税・地方税・社会保険料", "水道光熱費", "消耗品費・その他諸経費",
+    "その他固定費", "家賃", "広告費", "融資返済利息", "実質営業利益", "臨時諸経費", "（非課税）保険料・税金等", "最終営業利益", "インセンティブ支給総額", "税額計算利益",
+    "消費税額", "法人税額", "融資返済元金", "内部留保"
+]
+
+# 税抜PLは税額計算利益まで
+PL_ROWS_EXCLUDING_TAX = PL_ROWS[:PL_ROWS.index("税額計算利益") + 1]
+
+# --- 比率行の定義（行名, 総売上に対する分子の行, 直後に置く行） ---
+RATIO_ROWS = [
+    ("原価率", ["原価"], "原価"),
+    ("人件費率", ["人件費", "源泉税・地方税・社会保険料"], "源泉税・地方税・社会保険料"),
+    ("FL比率", ["原価", "人件費", "源泉税・地方税・社会保険料"], "人件費率"),
+    ("水道光熱費率", ["水道光熱費"], "水道光熱費"),
+    ("消耗品・その他諸経費率", ["消耗品費・その他諸経費"], "消耗品費・その他諸経費"),
+    ("その他固定費率", ["その他固定費"], "その他固定費"),
+    ("家賃率", ["家賃"], "家賃"),
+    ("FLR比率", ["原価", "人件費", "源泉税・地方税・社会保険料", "家賃"], "家賃率"),
+    ("広告費率", ["広告費"], "広告費"),
+    ("実質営業利益率", ["実質営業利益"], "実質営業利益"),
+    ("最終営業利益率", ["最終営業利益"], "最終営業利益"),
+]
+
+
+def _layout_with_ratios(rows: list) -> list:
+    """PL行の並びに、RATIO_ROWS の比率行を指定位置へ差し込んだ行順を返す"""
+    layout = list(rows)
+    for label, _, after in RATIO_ROWS:
+        layout.insert(layout.index(after) + 1, label)
+    return layout
+
+
+PL_LAYOUT = _layout_with_ratios(PL_ROWS)
+PL_LAYOUT_EXCLUDING_TAX = _layout_with_ratios(PL_ROWS_EXCLUDING_TAX)
+
+# 比率行 × 金額行 の分子の重み（0/1）
+RATIO_WEIGHTS = pd.DataFrame(
+    [[1.0 if row in numerators else 0.0 for row in PL_ROWS] for _, numerators, _ in RATIO_ROWS],
+    index=[label for label, _, _ in RATIO_ROWS],
+    columns=PL_ROWS
+)
+
+CORPORATE_TAX_RATE = 0.3358
+# 通期で課税所得が出ない場合の法人税額（均等割）
+MIN_ANNUAL_CORPORATE_TAX = 70000
+
+
+def _pivot(data: dict, line_map: dict, months: list) -> pd.DataFrame:
+    """{(year, month, key): 金額} を (PL行 × 年月) の表に展開する"""
+    records = pd.DataFrame(
+        [(y, m, k, v) for (y, m, k), v in data.items()],
+        columns=["year", "month", "key", "value"]
+    )
+    records = records[records["key"].isin(line_map.keys())]
+    records = records.assign(
+        line=records["key"].map(line_map),
+        ym=records["year"].astype(str) + "-" + records["month"].astype(str).str.zfill(2)
+    )
+    table = records.pivot_table(index="line", columns="ym", values="value", aggfunc="sum")
+    return table.reindex(index=list(line_map.values()), columns=months).fillna(0).astype(float)
+
+
+def build_pl_frame(sales_dict: dict, expense_dict: dict, months: list, excluding_tax: bool = False) -> pd.DataFrame:
+    """
+    集計テーブルの辞書から月別PLを組み立てる。
+    返り値は PL行 × ["合計"] + months の DataFrame。
+    派生行はすべて列単位の配列演算で計算し、「合計」列も同じ式で算出する。
+    excluding_tax=True の場合は税抜金額で計算し、税額以降の行を含めない。
+    """
+    base = pd.concat([
+        _pivot(sales_dict, SALES_LINES, months),
+        _pivot(expense_dict, EXPENSE_LINES, months),
+    ])
+    return _derive_pl(base, excluding_tax)
+
+
+def build_pl_frame_from_cube(cube_rows: list, months: list, excluding_tax: bool = False) -> pd.DataFrame:
+    """
+    pl_monthly（事業部 × 年月の1行1ヶ月）から月別PLを組み立てる。
+    複数事業部の行は年月ごとに合算し、派生行は build_pl_frame と同じ式で再計算する。
+    """
+    base_lines = list(SALES_LINES.values()) + list(EXPENSE_LINES.values())
+    base_columns = [PL_COLUMNS[line] for line in base_lines]
+    cube = pd.DataFrame(cube_rows, columns=["year", "month"] + base_columns)
+    cube["ym"] = cube["year"].astype(str) + "-" + cube["month"].astype(str).str.zfill(2)
+    base = cube.groupby("ym")[base_columns].sum().T.rename(index=dict(zip(base_columns, base_lines)))
+    base = base.reindex(index=base_lines, columns=months).fillna(0).astype(float)
+    return _derive_pl(base, excluding_tax)
+
+
+def _derive_pl(base: pd.DataFrame, excluding_tax: bool) -> pd.DataFrame:
+    """基礎行（売上・費目 × 年月）に合計列と派生行を加えてPLにする"""
+    if excluding_tax:
+        factors = pd.Series(TAX_FACTORS).reindex(base.index).fillna(1.0)
+        base = base.div(factors, axis=0)
+    base.insert(0, "合計", base.sum(axis=1))
+
+    pl = {line: base.loc[line] for line in base.index}
+    pl["総売上"] = pl["売上（税率10%）"] + pl["売上（税率8%）"] + pl["その他売上（税率10%）"] + pl["その他売上（税率8%）"]
+    pl["売上総利益"] = pl["総売上"] - pl["原価"]
+    pl["実質営業利益"] = (
+        pl["売上総利益"] - pl["人件費"] - pl["水道光熱費"] - pl["消耗品費・その他諸経費"]
+        - pl["その他固定費"] - pl["家賃"] - pl["広告費"] - pl["融資返済利息"]
+    )
+    pl["最終営業利益"] = pl["実質営業利益"] - pl["臨時諸経費"] - pl["（非課税）保険料・税金等"]
+    pl["税額計算利益"] = pl["最終営業利益"] - pl["インセンティブ支給総額"]
+
+    if excluding_tax:
+        return pd.DataFrame(pl).T.loc[PL_ROWS_EXCLUDING_TAX]
+
+    sales_10 = pl["売上（税率10%）"] + pl["その他売上（税率10%）"]
+    sales_8 = pl["売上（税率8%）"] + pl["その他売上（税率8%）"]
+    taxable_expense = (
+        pl["水道光熱費"] + pl["消耗品費・その他諸経費"] + pl["臨時諸経費"]
+        + pl["その他固定費"] + pl["家賃"] + pl["広告費"]
+    )
+    pl["消費税額"] = (
+        sales_10 - sales_10 / 1.1 +
+        sales_8 - sales_8 / 1.08 -
+        (pl["原価"] - pl["原価"] / 1.08) -
+        (taxable_expense - taxable_expense / 1.1)
+    )
+
+    # 課税所得がない月は0、通期（合計列）は均等割
+    taxable_income = pl["税額計算利益"] - pl["消費税額"]
+    floor = pd.Series(0.0, index=taxable_income.index)
+    floor["合計"] = MIN_ANNUAL_CORPORATE_TAX
+    pl["法人税額"] = (taxable_income * CORPORATE_TAX_RATE).where(taxable_income > 0, floor)
+    pl["内部留保"] = pl["税額計算利益"] - pl["消費税額"] - pl["法人税額"] - pl["融資返済元金"]
+
+    return pd.DataFrame(pl).T.loc[PL_ROWS]
+
+
+def add_ratio_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    build_pl_frame の結果に、総売上に対する比率行をまとめて追加する。
+    比率は RATIO_WEIGHTS との行列積で一括計算し、行の並びは定義済みの行順で一度に揃える。
+    総売上が0の列は0とする。
+    """
+    weights = RATIO_WEIGHTS.loc[:, df.index]
+    sales = df.loc["総売上"]
+    ratios = weights.dot(df).div(sales.where(sales != 0), axis=1).fillna(0.0)
+    layout = PL_LAYOUT if df.index.equals(pd.Index(PL_ROWS)) else PL_LAYOUT_EXCLUDING_TAX
+    return pd.concat([df, ratios]).reindex(layout)
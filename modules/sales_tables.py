@@ -3,16 +3,41 @@
 import streamlit as st
 import pandas as pd
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
-from db.all_sales import get_sales, add_sale, delete_sale, update_sales_total
+from db.all_sales import get_sales, add_sales_bulk, update_sales_bulk, delete_sales_bulk
 from db.income_sources import get_income_sources
-from db.supabase_client import supabase
+from modules.grid_diff import diff_grid
+from modules.monthly_state import state_key, load_cached, patch_cached, month_writes, merge_rows, shift_totals
 
+# 変更検出で比較するグリッドの列
+GRID_FIELDS = ["入金元", "詳細", "入金予定額", "入金済額", "入金手段", "請求書", "税区分"]
 
-def show_all_sales_tables(year: int, month: int, top_category: str):
-    show_sales_table(year, month, top_category)
 
+def show_all_sales_tables(year: int, month: int, top_category: str, version: int = None):
+    show_sales_table(year, month, top_category, version)
 
-def show_sales_table(year: int, month: int, top_category: str):
+
+def _patch_saved_sales(year: int, month: int, top_category: str, existing: list, versions: list,
+                       inserted=(), updated=(), deleted=()):
+    """
+    保存結果の行でセッション内の入金明細・入金集計を差し替え、書き込んだ版を記録する
+    versions: 書き込み順の一括書き込みの版。間に他の書き込みがあった・書き込み結果が揃っていない場合は差し替えず、次回に読み直す
+    """
+    writes = month_writes((top_category, year, month), *versions)
+    if any("id" not in row for row in [*inserted, *updated, *deleted]):
+        writes = None
+    updated_ids = {row["id"] for row in updated}
+    old_rows = [row for row in existing if row["id"] in updated_ids]
+
+    def patch_totals(totals):
+        totals = shift_totals(totals, [*deleted, *old_rows], lambda row: row.get("tax_rate"), "received_amount", -1)
+        return shift_totals(totals, [*inserted, *updated], lambda row: row.get("tax_rate"), "received_amount", 1)
+
+    patch_cached(state_key("sales_rows", year, month, top_category), writes,
+                 lambda rows: merge_rows(rows, inserted, updated, deleted))
+    patch_cached(state_key("sales_totals", year, month, top_category), writes, patch_totals)
+
+
+def show_sales_table(year: int, month: int, top_category: str, version: int = None):
     st.markdown(f"### 入金明細")
 
     key_prefix = f"sales_{top_category.replace(' ', '_')}"
@@ -27,7 +52,9 @@ def show_sales_table(year: int, month: int, top_category: str):
         st.session_state.pop(data_key, None)
         st.session_state[last_month_key] = current_key
 
-    existing = get_sales(year, month, top_category)
+    # 版（version）が前回と同じなら、セッションに保存した明細をそのまま使う
+    existing = load_cached(state_key("sales_rows", year, month, top_category), version,
+                           lambda: get_sales(year, month, top_category))
     existing_df = pd.DataFrame([
         {
             "id": row["id"],
@@ -94,24 +121,30 @@ def show_sales_table(year: int, month: int, top_category: str):
         col3a, col3b = st.columns(2)
         with col3a:
             if st.button("登録", key=f"register_{key_prefix}"):
-                inserted = 0
-                for _, row in updated_df.iterrows():
-                    if pd.isna(row.get("id")) and row["入金元"] and row["入金手段"]:
-                        success = add_sale(
-                            year, month,
-                            row["入金元"],
-                            row["詳細"],
-                            row["入金予定額"],
-                            row["入金済額"],
-                            row["入金手段"],
-                            top_category,
-                            row["請求書"],
-                            row["税区分"]
-                        )
-                        if success:
-                            inserted += 1
+                new_df, _, _, _ = diff_grid(updated_df, existing_df, GRID_FIELDS)
+                rows = [
+                    {
+                        "partner": row["入金元"],
+                        "detail": row["詳細"],
+                        "expected_amount": row["入金予定額"],
+                        "received_amount": row["入金済額"],
+                        "payment": row["入金手段"],
+                        "invoice_issued": row["請求書"],
+                        "tax_rate": row["税区分"]
+                    }
+                    for row in new_df.to_dict("records")
+                    if row["入金元"] and row["入金手段"]
+                ]
+
+                # --- 1回の insert でまとめて登録 ---
+                results, versions = add_sales_bulk(year, month, rows, top_category)
+                inserted_rows = [row for row in results if row]
+                inserted = len(inserted_rows)
+                failed = len(results) - inserted
+                if failed:
+                    st.error(f"{failed} 件の登録に失敗しました")
                 if inserted:
-                    update_sales_total(year, month, top_category)
+                    _patch_saved_sales(year, month, top_category, existing, [versions], inserted=inserted_rows)
                     st.success(f"{inserted} 件を登録しました")
                     st.session_state.pop(data_key, None)
                     st.rerun()
@@ -122,36 +155,51 @@ def show_sales_table(year: int, month: int, top_category: str):
             if st.button("更新", key=f"update_{key_prefix}"):
                 updated = 0
                 deleted = 0
-                for _, row in updated_df.iterrows():
-                    if row["操作"] == "削除" and not pd.isna(row.get("id")):
-                        delete_sale(int(row["id"]))
-                        deleted += 1
-                    elif row["操作"] != "削除" and not pd.isna(row.get("id")):
-                        old = existing_df[existing_df["id"] == row["id"]]
-                        if not old.empty:
-                            ex = old.iloc[0]
-                            if any([
-                                row["入金元"] != ex["入金元"],
-                                row["詳細"] != ex["詳細"],
-                                row["入金予定額"] != ex["入金予定額"],
-                                row["入金済額"] != ex["入金済額"],
-                                row["入金手段"] != ex["入金手段"],
-                                row["請求書"] != ex["請求書"],
-                                row["税区分"] != ex["税区分"]
-                            ]):
-                                supabase.table("all_sales").update({
-                                    "partner": row["入金元"],
-                                    "detail": row["詳細"],
-                                    "expected_amount": row["入金予定額"],
-                                    "received_amount": row["入金済額"],
-                                    "payment": row["入金手段"],
-                                    "invoice_issued": row["請求書"],
-                                    "tax_rate": row["税区分"]
-                                }).eq("id", int(row["id"])).execute()
-                                updated += 1
+
+                # --- 取得時の行と id で突き合わせ、変更行と削除行をまとめて抽出 ---
+                _, changed_df, delete_ids, _ = diff_grid(updated_df, existing_df, GRID_FIELDS)
+                changed_rows = [
+                    {
+                        "id": int(row["id"]),
+                        "year": year,
+                        "month": month,
+                        "partner": row["入金元"],
+                        "detail": row["詳細"],
+                        "expected_amount": row["入金予定額"],
+                        "received_amount": row["入金済額"],
+                        "payment": row["入金手段"],
+                        "invoice_issued": row["請求書"],
+                        "tax_rate": row["税区分"],
+                        "top_category": top_category
+                    }
+                    for row in changed_df.to_dict("records")
+                ]
+
+                # --- 1リクエストでまとめて削除・更新 ---
+                deleted_rows = []
+                updated_rows = []
+                versions = []
+                if delete_ids:
+                    deleted_rows, delete_versions = delete_sales_bulk(delete_ids, (top_category, year, month))
+                    versions.append(delete_versions)
+                    if deleted_rows is not None:
+                        deleted = len(delete_ids)
+                    else:
+                        deleted_rows = []
+                        st.error(f"{len(delete_ids)} 件の削除が失敗しました")
+
+                if changed_rows:
+                    updated_rows, update_versions = update_sales_bulk(changed_rows)
+                    versions.append(update_versions)
+                    if updated_rows is not None:
+                        updated = len(changed_rows)
+                    else:
+                        updated_rows = []
+                        st.error(f"{len(changed_rows)} 件の更新が失敗しました")
 
                 if deleted or updated:
-                    update_sales_total(year, month, top_category)
+                    _patch_saved_sales(year, month, top_category, existing, versions,
+                                       updated=updated_rows, deleted=deleted_rows)
                     if deleted: st.success(f"{deleted} 件を削除しました")
                     if updated: st.success(f"{updated} 件を更新しました")
                     st.session_state.pop(data_key, None)
@@ -0,0 +1,33 @@
+# pl_monthly_backfill.py
+#
+# pl_monthly（事業部 × 年月の月次PL）へ既存の売上・出金合計をまとめて投入するバッチ
+# 投入した年は pl_monthly_backfills に記録され、ダッシュボードがその年から pl_monthly を読むようになる
+# Supabase の接続情報は画面と同じく .streamlit/secrets.toml から読むため、リポジトリ直下で実行する
+#
+#   python pl_monthly_backfill.py                 # 1期目の開始年〜来年
+#   python pl_monthly_backfill.py 2024 2025       # 2024年・2025年
+#
+# db/pl_monthly.sql を適用した直後に1回実行する（再実行しても同じ内容で上書きされる）
+
+import argparse
+import logging
+import sys
+from datetime import date
+from db.pl_monthly import rebuild_pl_monthly
+from fixed_expense_batch import TERM_START_YEAR
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="pl_monthly に既存の売上・出金合計を投入する")
+    parser.add_argument("years", type=int, nargs="*", help="対象年（省略時は1期目の開始年〜来年）")
+    args = parser.parse_args(argv)
+
+    years = args.years or list(range(TERM_START_YEAR, date.today().year + 2))
+    success = rebuild_pl_monthly(years)
+    logging.info(f"pl_monthly 投入 {min(years)}〜{max(years)}: {'完了' if success else '失敗'}")
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# reconcile_totals_batch.py
+#
+# 差分の加算で維持している合計テーブル（入金・出金・減価償却）を明細と突き合わせて補正するバッチ
+# ずれていた月だけを全件再集計し、その月の pl_monthly と data_versions も更新する
+# Supabase の接続情報は画面と同じく .streamlit/secrets.toml から読むため、リポジトリ直下で実行する
+#
+#   python reconcile_totals_batch.py              # 当期（8月〜翌7月）の全月
+#   python reconcile_totals_batch.py --term 6     # 6期目の全月
+#   python reconcile_totals_batch.py 2025 7       # 2025年7月のみ
+#
+# cron 等で毎晩（保存の少ない時間帯に）実行する想定
+
+import argparse
+import logging
+import sys
+from datetime import date
+from db.totals import reconcile_totals
+from db.pl_monthly import refresh_pl_monthly_batch
+from fixed_expense_batch import TERM_START_YEAR, term_periods
+
+# (明細テーブル, 合計テーブル, グループ列, 金額列, 合計列)
+TOTAL_TABLES = [
+    ("all_sales", "all_sales_total", "tax_rate", "received_amount", "total_amount"),
+    ("all_expense", "all_expense_total", "second_category", "cost", "total_cost"),
+    ("all_expense_depreciation", "all_expense_total_depreciation", "second_category", "cost", "total_cost"),
+]
+
+
+def current_term() -> int:
+    """今日が属する期（modules.monthly_io.generate_terms と同じ数え方）"""
+    today = date.today()
+    return (today.year - TERM_START_YEAR) + (1 if today.month >= 8 else 0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="合計テーブルを明細と突き合わせて補正する")
+    parser.add_argument("year", type=int, nargs="?", help="対象年（省略時は当期の全月）")
+    parser.add_argument("month", type=int, nargs="?", help="対象月（省略時は当期の全月）")
+    parser.add_argument("--term", type=int, help="対象の期（指定時は期内の全月）")
+    args = parser.parse_args(argv)
+
+    if args.year and args.month and not args.term:
+        start_period = end_period = args.year * 100 + args.month
+    else:
+        start_period, end_period = term_periods(args.term or current_term())
+
+    success = True
+    touched = set()
+    for ledger, total_table, group_column, amount_column, total_column in TOTAL_TABLES:
+        repaired = reconcile_totals(ledger, total_table, group_column, amount_column, total_column,
+                                    start_period, end_period)
+        if repaired is None:
+            success = False
+            continue
+        logging.info(f"合計補正 {total_table} {start_period}〜{end_period}: {len(repaired)} か月を再集計")
+        touched |= repaired
+
+    # 再集計した月の pl_monthly を作り直し、版を進める
+    if refresh_pl_monthly_batch(touched) is None:
+        success = False
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(main())